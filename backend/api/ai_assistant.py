@@ -1,44 +1,182 @@
 """
 AI Assistant API router - handles AI assistant requests
 """
-from typing import Optional, List, Dict, Any
+import asyncio
+from collections import OrderedDict, deque
+from dataclasses import dataclass
+from functools import lru_cache
+import hashlib
+import json
+from pathlib import Path
+import secrets
+from typing import Optional, List, Dict, Any, Tuple
 from fastapi import APIRouter, Request
-from pydantic import BaseModel, Field
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from pydantic import (
+    BaseModel,
+    ConfigDict,
+    Field,
+    ValidationError,
+    field_validator,
+)
+import pydantic_core
+import httpx
 import structlog
 import os
-import re
 from pydantic_ai import Agent
-from pydantic_ai.models.openai import OpenAIChatModel
-from pydantic_ai.models.google import GoogleModel
-from pydantic_ai.providers.google import GoogleProvider
-from middleware.rate_limit import token_tracker
+from middleware.rate_limit import (
+    get_rate_limit_key,
+    get_redis_connection,
+    token_tracker,
+)
 
 logger = structlog.get_logger()
-router = APIRouter()
 
 
-def get_ai_model():
-    """Get AI model based on environment configuration"""
-    provider = os.getenv("AI_PROVIDER", "openai").lower()
+class FastJSONResponse(JSONResponse):
+    """JSON response rendered by pydantic-core's native serializer"""
+
+    def render(self, content: Any) -> bytes:
+        return pydantic_core.to_json(content)
+
+
+router = APIRouter(default_response_class=FastJSONResponse)
+
+# Shared HTTP client so AI provider calls reuse keep-alive connections
+http_client = httpx.AsyncClient(
+    limits=httpx.Limits(
+        max_keepalive_connections=16,
+        max_connections=32,
+        keepalive_expiry=90
+    ),
+    timeout=httpx.Timeout(120.0)
+)
+
+
+async def close_http_client():
+    """Close the shared AI provider HTTP client"""
+    await http_client.aclose()
+
+
+@dataclass(frozen=True)
+class AISettings:
+    """AI provider configuration, read from the environment at startup"""
+    provider: str
+    openai_api_key: Optional[str]
+    google_api_key: Optional[str]
+
+    @classmethod
+    def from_env(cls) -> "AISettings":
+        return cls(
+            provider=os.getenv("AI_PROVIDER", "openai").lower(),
+            openai_api_key=os.getenv("OPENAI_API_KEY"),
+            google_api_key=os.getenv("GOOGLE_API_KEY")
+        )
+
+
+ai_settings = AISettings.from_env()
+
+
+def get_ai_config() -> tuple[str, str]:
+    """Get the (provider, api_key) pair from the AI settings"""
+    provider = ai_settings.provider
 
     if provider == "openai":
-        api_key = os.getenv("OPENAI_API_KEY")
+        api_key = ai_settings.openai_api_key
         if not api_key:
             raise ValueError("OpenAI API key not configured")
-        # Set the API key in environment for OpenAI
-        os.environ["OPENAI_API_KEY"] = api_key
-        return OpenAIChatModel("gpt-4o-mini")
     elif provider == "gemini":
-        api_key = os.getenv("GOOGLE_API_KEY")
+        api_key = ai_settings.google_api_key
         if not api_key:
             raise ValueError("Google API key not configured")
-        provider = GoogleProvider(api_key=api_key)
-        return GoogleModel("gemini-2.5-pro", provider=provider)
     else:
         raise ValueError(f"Unsupported AI provider: {provider}")
 
+    return provider, api_key
+
+
+def get_ai_model():
+    """Get AI model based on environment configuration"""
+    return build_ai_model(*get_ai_config())
+
 
-# AI agent will be created dynamically in the chat function
+# Model used for each provider
+AI_MODEL_NAMES = {
+    "openai": "gpt-4o-mini",
+    "gemini": "gemini-2.5-pro",
+}
+
+
+@lru_cache(maxsize=4)
+def build_ai_model(provider: str, api_key: str):
+    """
+    Build the AI model for a provider, reused while its configuration
+    stays the same. Provider SDKs are imported here so only the
+    configured one is loaded.
+    """
+    if provider == "openai":
+        from pydantic_ai.models.openai import OpenAIChatModel
+        from pydantic_ai.providers.openai import OpenAIProvider
+
+        return OpenAIChatModel(
+            AI_MODEL_NAMES["openai"],
+            provider=OpenAIProvider(api_key=api_key, http_client=http_client)
+        )
+
+    from pydantic_ai.models.google import GoogleModel
+    from pydantic_ai.providers.google import GoogleProvider
+
+    return GoogleModel(
+        AI_MODEL_NAMES["gemini"],
+        provider=GoogleProvider(api_key=api_key, http_client=http_client)
+    )
+
+
+MODIFIED_CODE_OPEN_TAG = '<modified_code>'
+MODIFIED_CODE_CLOSE_TAG = '</modified_code>'
+
+# Substrings that make a plain python block look like a contract file
+CONTRACT_SIGNATURES = ("from hathor", "import", "class", "@export")
+
+
+def _find_fenced_block(
+    text: str,
+    opener: str,
+    pos: int = 0
+) -> Optional[str]:
+    """
+    Return the body of the first fenced block at or after `pos` starting
+    with `opener` and closed by a newline followed by ```, or None if
+    there is none.
+    """
+    start = text.find(opener, pos)
+    if start < 0:
+        return None
+    start += len(opener)
+    end = text.find('\n```', start)
+    if end < 0:
+        return None
+    return text[start:end]
+
+
+def _strip_code_fence(code: str, opener: Optional[str] = None) -> str:
+    """
+    Remove the opening fence line and a closing ``` line from `code`.
+    If `opener` is given, the first line is only removed when it matches it.
+    """
+    start = 0
+    first_newline = code.find('\n')
+    first_line = code if first_newline < 0 else code[:first_newline]
+    if opener is None or first_line.strip() == opener:
+        if first_newline < 0:
+            return ''
+        start = first_newline + 1
+
+    last_newline = code.rfind('\n', start)
+    last_line_start = last_newline + 1 if last_newline >= 0 else start
+    if code[last_line_start:].strip() == '```':
+        return code[start:max(last_newline, start)]
+    return code[start:]
 
 
 def extract_modified_code_from_response(
@@ -51,61 +189,51 @@ def extract_modified_code_from_response(
     """
     try:
         # First, try to extract code from <modified_code> XML tags
-        modified_code_match = re.search(
-            r'<modified_code>(.*?)</modified_code>',
-            response_text,
-            re.DOTALL
-        )
-
-        if modified_code_match:
-            modified_code = modified_code_match.group(1).strip()
-
-            # Remove any code block markers that might be inside the XML
-            if modified_code.startswith('```python'):
-                # Remove opening ```python and closing ```
-                lines = modified_code.split('\n')
-                if lines[0].strip() == '```python':
-                    lines = lines[1:]  # Remove first line
-                if lines and lines[-1].strip() == '```':
-                    lines = lines[:-1]  # Remove last line
-                modified_code = '\n'.join(lines)
-            elif modified_code.startswith('```') \
-                    and modified_code.endswith('```'):
-                # Remove any other code block markers
-                lines = modified_code.split('\n')
-                if lines[0].startswith('```'):
-                    lines = lines[1:]
-                if lines and lines[-1].strip() == '```':
-                    lines = lines[:-1]
-                modified_code = '\n'.join(lines)
+        start = response_text.find(MODIFIED_CODE_OPEN_TAG)
+        end = response_text.find(
+            MODIFIED_CODE_CLOSE_TAG, start + len(MODIFIED_CODE_OPEN_TAG)
+        ) if start >= 0 else -1
+
+        if end >= 0:
+            modified_code = response_text[
+                start + len(MODIFIED_CODE_OPEN_TAG):end].strip()
+
+            # Remove any code block markers that might be inside the XML,
+            # unfenced code only pays for a single prefix check
+            if modified_code.startswith('```'):
+                if modified_code.startswith('```python'):
+                    modified_code = _strip_code_fence(
+                        modified_code, '```python')
+                elif modified_code.endswith('```'):
+                    modified_code = _strip_code_fence(modified_code)
 
             logger.info(
                 "Successfully extracted code from <modified_code> XML tag")
             return None, original_code, modified_code
 
+        # Chat-only replies have no fenced block, and fallbacks are only
+        # used when there is original code to pair the block with
+        first_fence = response_text.find('```') if original_code else -1
+        if first_fence < 0:
+            logger.debug("No modified code found in response")
+            return None, None, None
+
         # Fallback: look for ```python:modified blocks (legacy support)
-        modified_pattern = r'```python:modified\n(.*?)\n```'
-        modified_matches = re.findall(
-            modified_pattern, response_text, re.DOTALL)
+        modified_code = _find_fenced_block(
+            response_text, '```python:modified\n', first_fence)
 
-        if modified_matches and original_code:
-            modified_code = modified_matches[0]
+        if modified_code is not None:
             logger.info("Extracted code from python:modified block (legacy)")
             return None, original_code, modified_code
 
         # Second fallback: regular python blocks if they contain full
         # contract structure
-        regular_pattern = r'```python\n(.*?)\n```'
-        regular_matches = re.findall(
-            regular_pattern, response_text, re.DOTALL)
+        modified_code = _find_fenced_block(
+            response_text, '```python\n', first_fence)
 
-        if regular_matches and original_code:
-            modified_code = regular_matches[0]
+        if modified_code is not None:
             # Check if this looks like a complete contract file
-            if ("from hathor" in modified_code or
-                    "import" in modified_code or
-                    "class" in modified_code or
-                    "@export" in modified_code):
+            if any(sig in modified_code for sig in CONTRACT_SIGNATURES):
                 logger.warning(
                     "Extracted code from regular python block - "
                     "AI should use <modified_code> XML tags")
@@ -121,1922 +249,627 @@ def extract_modified_code_from_response(
         return None, None, None
 
 
+class ModifiedCodeStreamParser:
+    """
+    Incrementally pull the body of the first <modified_code> tag out of a
+    streamed AI response. Tags split across chunks are handled by holding
+    back a tail shorter than the tag being searched for.
+    """
+
+    def __init__(self):
+        self.buffer = ''
+        self.inside = False
+        self.done = False
+
+    def feed(self, text: str) -> str:
+        """Consume a chunk and return any new modified code it completes"""
+        if self.done:
+            return ''
+        self.buffer += text
+
+        if not self.inside:
+            start = self.buffer.find(MODIFIED_CODE_OPEN_TAG)
+            if start < 0:
+                self.buffer = self.buffer[
+                    -(len(MODIFIED_CODE_OPEN_TAG) - 1):]
+                return ''
+            self.buffer = self.buffer[start + len(MODIFIED_CODE_OPEN_TAG):]
+            self.inside = True
+
+        end = self.buffer.find(MODIFIED_CODE_CLOSE_TAG)
+        if end >= 0:
+            code = self.buffer[:end]
+            self.buffer = ''
+            self.done = True
+            return code
+
+        keep = len(MODIFIED_CODE_CLOSE_TAG) - 1
+        code = self.buffer[:-keep]
+        self.buffer = self.buffer[-keep:]
+        return code
+
+
+# Upper bound for any string in a chat request, oversized payloads are
+# rejected during validation before reaching the AI
+MAX_CHAT_STRING_LENGTH = 200_000
+
+# Only the tail of the execution logs is sent to the AI, errors and the
+# final state are at the end
+MAX_EXECUTION_LOG_CHARS = 8_000
+
+
 class ChatMessage(BaseModel):
     """Individual chat message"""
+    model_config = ConfigDict(
+        frozen=True, str_max_length=MAX_CHAT_STRING_LENGTH)
+
     role: str  # 'user' or 'assistant'
     content: str
 
 
 class ChatRequest(BaseModel):
     """Request to chat with AI assistant"""
+    model_config = ConfigDict(
+        frozen=True, str_max_length=MAX_CHAT_STRING_LENGTH)
+
     message: str
     current_file_content: Optional[str] = None
     current_file_name: Optional[str] = None
-    console_messages: List[str] = Field(default_factory=list)
+    # Only the last 5 console messages and 6 history entries reach the AI
+    console_messages: List[str] = Field(
+        default_factory=list, max_length=50)
     execution_logs: Optional[str] = None  # Logs from Pyodide execution
     context: Optional[Dict[str, Any]] = None
     # Recent conversation history
-    conversation_history: List[ChatMessage] = Field(default_factory=list)
+    conversation_history: List[ChatMessage] = Field(
+        default_factory=list, max_length=20)
+    # Chat session id issued by the server in a previous ChatResponse
+    session_id: Optional[str] = Field(default=None, max_length=128)
+
+    @field_validator("execution_logs", mode="before")
+    @classmethod
+    def keep_execution_logs_tail(cls, logs: Any) -> Any:
+        """Keep the tail of long logs instead of rejecting the request"""
+        if isinstance(logs, str) and len(logs) > MAX_CHAT_STRING_LENGTH:
+            return logs[-MAX_CHAT_STRING_LENGTH:]
+        return logs
 
 
 class ChatResponse(BaseModel):
     """Response from AI assistant"""
+    # Responses are cached and shared between requests
+    model_config = ConfigDict(frozen=True)
+
     success: bool
     message: str
     error: Optional[str] = None
     suggestions: List[str] = []
     original_code: Optional[str] = None  # Original code
     modified_code: Optional[str] = None  # Modified code
+    # Chat session to send back with the next request, never cached
+    session_id: Optional[str] = None
 
 
-# Hathor-specific system prompt
-HATHOR_SYSTEM_PROMPT = """
-## 🎯 Agent Role & Personality
-
-You are an expert Hathor Network Blueprint developer specializing in nano contracts.
-
-**Your mission**: Help developers build, test, and deploy production-ready Hathor Blueprints (Python smart contracts that run on the Hathor blockchain).
-
-### Approach
-- **Expert but approachable**: You have deep knowledge of Hathor nano contracts
-- **Security-conscious**: Prevent common mistakes and vulnerabilities
-
-## 🔧 IMPORTANT: Code Modification Instructions
-
-When you provide modified or corrected code to the user, you MUST wrap the complete modified code in `<modified_code>` XML tags. This allows the frontend to show a visual diff and apply button.
-
-### Examples:
-
-**❌ WRONG - Plain code blocks:**
-```python
-from hathor import Blueprint, public, export
-
-@export  
-class Counter(Blueprint):
-    count: int
-```
-
-**✅ CORRECT - Use XML tags for modified code:**
-<modified_code>
-from hathor import Blueprint, public, export
-
-@export  
-class Counter(Blueprint):
-    count: int
-    
-    @public
-    def initialize(self, ctx: Context, initial: int) -> None:
-        self.count = initial
-</modified_code>
-
-**Rules for <modified_code> tags:**
-1. Use ONLY when providing corrected/modified versions of existing user code
-2. Include the COMPLETE file contents, not just the changed parts
-3. Do NOT use for examples, explanations, or new code suggestions
-4. The modified code should be ready to replace the user's current file
-
----
-
-## 🚨 CRITICAL IMPORT RESTRICTIONS
-
-### Rule 0: ONLY These Imports Are Allowed
-
-**NEVER use any imports other than these exact imports:**
-
-#### Standard Python Imports (ONLY these specific ones)
-```python
-# Math functions
-from math import ceil, floor
-
-# Typing utilities
-from typing import Optional, NamedTuple, TypeAlias, Union
-
-# Collections
-from collections import OrderedDict
-```
-
-#### Hathor-Specific Imports (ONLY from hathor module)
-```python
-from hathor import (
-    Address,
-    Amount,
-    Blueprint,
-    BlueprintId,
-    CallerId,
-    Context,
-    ContractId,
-    HATHOR_TOKEN_UID,
-    NCAcquireAuthorityAction,
-    NCAction,
-    NCActionType,
-    NCArgs,
-    NCDepositAction,
-    NCFail,
-    NCFee,
-    NCGrantAuthorityAction,
-    NCParsedArgs,
-    NCRawArgs,
-    NCWithdrawalAction,
-    SignedData,
-    Timestamp,
-    TokenUid,
-    TxOutputScript,
-    VertexId,
-    export,
-    fallback,
-    public,
-    sha3,
-    verify_ecdsa,
-    view,
-)
-```
-
-### Import Rules Enforcement
-
-❌ **FORBIDDEN**:
-```python
-import hashlib          # NO - use from x import y syntax only
-import os              # NO - not in allowed list
-import json            # NO - not in allowed list  
-import requests        # NO - not in allowed list
-import datetime        # NO - not in allowed list
-from datetime import datetime  # NO - not in allowed list
-from hashlib import sha256     # NO - not in allowed list
-from typing import Dict, List  # NO - only Optional, NamedTuple, TypeAlias, Union allowed
-```
-
-✅ **ALLOWED**:
-```python
-from math import ceil, floor
-from typing import Optional, NamedTuple, TypeAlias, Union
-from collections import OrderedDict
-from hathor import Blueprint, public, view, Context, export, NCFail
-```
-
-### Why These Restrictions Exist
-
-- **Security**: Prevents access to dangerous system functions
-- **Determinism**: Ensures contracts behave identically across all nodes  
-- **Consensus**: Maintains blockchain state consistency
-- **Sandboxing**: Limits contract capabilities to safe, audited functions
-
-**IMPORTANT**: If user code contains forbidden imports, you MUST point out the violation and provide the corrected imports using only the allowed list above.
-
----
-
-## Critical rules:
-
-### Rule 1: All Attributes Must Be Explicitly Initialized
-❌ WRONG:
-```python
-class MyContract(Blueprint):
-    balances: dict[Address, int]
-    total_supply: int
-
-@public
-def initialize(self, ctx: Context):
-    # Missing initialization - attributes not set!
-    pass
-```
-
-✅ CORRECT:
-```python
-class MyContract(Blueprint):
-    balances: dict[Address, int]
-    total_supply: int
-
-@public
-def initialize(self, ctx: Context):
-    self.balances = {}  # Must initialize all attributes
-    self.total_supply = 0
-```
-
-### Rule 2: Use initialize(), NOT __init__
-❌ WRONG: `def __init__(self):`
-✅ CORRECT: `def initialize(self, ctx: Context, ...):`
-
-### Rule 3: Always Export Blueprint
-❌ WRONG: Missing @export decorator
-✅ CORRECT: Use `@export` decorator on your class
-
-### Rule 4: Decorators Are Required
-❌ WRONG: Method without @public or @view
-✅ CORRECT:
-- `@public` for state-changing methods (requires `ctx: Context`)
-- `@view` for read-only methods (no `ctx` parameter)
-
-### Rule 5: No Default Values in @public/@view Methods
-❌ WRONG:
-```python
-@public
-def initialize(self, ctx: Context, initial_value: int = 0) -> None:
-    # Default values not allowed in public methods!
-
-@view
-def get_balance(self, address: Address = None) -> int:
-    # Default values not allowed in view methods!
-```
-
-✅ CORRECT:
-```python
-@public
-def initialize(self, ctx: Context, initial_value: int) -> None:
-    # No default values - caller must provide all arguments
-
-@view
-def get_balance(self, address: Address) -> int:
-    # No default values - all parameters are required
-
-# Internal methods CAN have defaults:
-def _internal_helper(self, value: int = 0) -> int:
-    return value * 2
-```
-
-**Why**: Default values can cause ABI compatibility issues and make contract calls ambiguous.
-
-### Rule 6: ALL Attributes Must Be Initialized
-❌ WRONG:
-```python
-class MyContract(Blueprint):
-    owner: Address
-    balances: dict[Address, int]
-    total_supply: int
-
-    @public
-    def initialize(self, ctx: Context, owner: Address) -> None:
-        self.owner = owner
-        # Missing initialization of other attributes!
-```
-
-✅ CORRECT:
-```python
-class MyContract(Blueprint):
-    owner: Address
-    balances: dict[Address, int]
-    total_supply: int
-
-    @public
-    def initialize(self, ctx: Context, owner: Address) -> None:
-        self.owner = owner
-        self.balances = {}  # Initialize even if empty
-        self.total_supply = 0  # Initialize all attributes
-```
-
-**Why**: All declared attributes must be explicitly initialized in the `initialize` method, even if they start as empty containers or zero values.
-
----
-
-## 📚 HATHOR BLUEPRINT FUNDAMENTALS
-
-### Blueprint Structure
-
-```python
-from hathor import Blueprint, public, view, Context, export
-
-@export
-class MyBlueprint(Blueprint):
-    # 1. FIELD DECLARATIONS (type annotations only)
-    counter: int
-    owner: Address
-    balances: dict[Address, int]
-
-    # 2. INITIALIZE METHOD (required, must be @public)
-    @public
-    def initialize(self, ctx: Context, initial_value: int) -> None:
-        self.counter = initial_value
-        self.owner = ctx.get_caller_address()
-        self.balances = {}  # Initialize all declared attributes!
-
-    # 3. PUBLIC METHODS (state-changing, require ctx)
-    @public
-    def increment(self, ctx: Context) -> None:
-        self.counter += 1
-
-    # 4. VIEW METHODS (read-only, no ctx)
-    @view
-    def get_count(self) -> int:
-        return self.counter
-```
-
-
-### Supported Field Types
-
-#### Primitive Types
-- `int`: Signed integer (arbitrary precision)
-- `bool`: Boolean (True/False)
-- `str`: String (UTF-8)
-- `bytes`: Byte array
-
-#### Hathor Types
-- `Address`: Wallet address (25 bytes)
-- `ContractId`: Contract identifier (32 bytes)
-- `TokenUid`: Token unique ID (32 bytes)
-- `TxOutputScript`: Script for validation
-- `SignedData[T]`: Cryptographically signed data
-
-#### Container Types (Special Hathor Implementations!)
-- `dict[K, V]`: Key-value mapping (becomes **DictContainer**)
-- `set[T]`: Unique values (becomes **SetContainer**)
-- `list[T]`: Ordered values (becomes **DequeContainer**)
-- `tuple[...]`: Immutable sequence
-- `Optional[T]`: Value or None
-
-#### Complex Types
-- `tuple[A, B, C]`: Fixed-size tuple
-- `NamedTuple`: Named tuple fields
-- Dataclasses (with @dataclass)
-
----
-
-## 🏗️ HATHOR CONTAINER TYPES - CRITICAL UNDERSTANDING
-
-### Important: dict ≠ dict, list ≠ list, set ≠ set
-
-**In Hathor Blueprints, when you declare `dict`, `list`, or `set` types, they are NOT standard Python containers. They are special Hathor container types that persist to blockchain storage:**
-
-- `dict[K, V]` → **DictContainer** (not Python dict)
-- `list[T]` → **DequeContainer** (not Python list)  
-- `set[T]` → **SetContainer** (not Python set)
-
-### Key Differences from Standard Python
-
-#### DictContainer vs dict
-```python
-# Declaration (looks like dict, but it's DictContainer)
-class MyContract(Blueprint):
-    balances: dict[Address, int]  # This is DictContainer!
-    
-    @public
-    def initialize(self, ctx: Context) -> None:
-        self.balances = {}  # Initialize as empty DictContainer
-
-# Usage differences:
-@public
-def example(self, ctx: Context) -> None:
-    # ✅ WORKS: Basic dict operations
-    self.balances[address] = 100
-    balance = self.balances.get(address, 0)
-    del self.balances[address]
-    
-    # ✅ WORKS: membership
-    if address in self.balances:
-        pass
-    
-    # ❌ NOT IMPLEMENTED: Some dict methods
-    # self.balances.keys()      # May not work
-    # self.balances.values()    # May not work  
-    # self.balances.items()     # May not work
-    # self.balances.copy()      # Not implemented
-
-    # ❌ NOT IMPLEMENTED: Iteration does not work!!
-    # for address in self.balances: # <-- WILL NOT WORK
-    #    pass
-```
-
-#### DequeContainer vs list
-```python
-# Declaration (looks like list, but it's DequeContainer)
-class MyContract(Blueprint):
-    items: list[str]  # This is DequeContainer!
-    
-    @public
-    def initialize(self, ctx: Context) -> None:
-        self.items = []  # Initialize as empty DequeContainer
-
-# Usage differences:
-@public
-def example(self, ctx: Context) -> None:
-    # ✅ WORKS: Basic sequence operations
-    self.items.append("item")
-    self.items.extend(["a", "b", "c"])
-    item = self.items[0]        # Access by index
-    self.items[0] = "new_item"  # Set by index
-    length = len(self.items)
-    
-    # ✅ WORKS: Deque-specific operations  
-    self.items.appendleft("first")
-    self.items.extendleft(["x", "y"])
-    first = self.items.popleft()
-    last = self.items.pop()
-    self.items.reverse()
-    
-    # ✅ WORKS: Iteration
-    for item in self.items:
-        pass
-    
-    # ❌ NOT IMPLEMENTED: Some list methods
-    # self.items.insert(1, "item")  # Not implemented
-    # self.items.remove("item")     # Not implemented
-    # self.items.sort()             # Not implemented
-    # self.items.index("item")      # Not implemented
-```
-
-#### SetContainer vs set
-```python
-# Declaration (looks like set, but it's SetContainer)
-class MyContract(Blueprint):
-    members: set[Address]  # This is SetContainer!
-    members2: set[Address]
-    
-    @public
-    def initialize(self, ctx: Context) -> None:
-        self.members = set()  # Initialize as empty SetContainer
-
-# Usage differences:
-@public
-def example(self, ctx: Context) -> None:
-    # ✅ WORKS: Basic set operations
-    self.members.add(address)
-    self.members.discard(address) 
-    self.members.remove(address)  # Raises KeyError if not found
-    self.members.update([addr1, addr2])
-    
-    # ✅ WORKS: Membership and size
-    if address in self.members:
-        pass
-    size = len(self.members)
-    
-    # ✅ WORKS: Some set operations
-    other_set: set = set()
-    is_disjoint = self.members.isdisjoint(other_set)
-    is_superset = self.members.issuperset(other_set)
-    intersection = self.members.intersection(other_set)
-
-    # ❌ NOT IMPLEMENTED: set operations with other containers
-    is_disjoint = self.members.isdisjoint(self.members2)
-    is_superset = self.members.issuperset(self.members2)
-    intersection = self.members.intersection(self.members2)
-    
-    # ❌ NOT IMPLEMENTED: Many set methods
-    # self.members.copy()                    # Not implemented
-    # self.members.union(other)              # Not implemented
-    # self.members.difference(other)         # Not implemented
-    # self.members.symmetric_difference()    # Not implemented
-```
-
-### Why These Special Containers Exist
-
-1. **Blockchain Storage**: Standard Python containers can't persist to blockchain storage
-2. **Merkle Patricia Trie**: Data is stored in a trie structure for efficient blockchain operations
-
-### Container Initialization Patterns
-
-```python
-class TokenContract(Blueprint):
-    balances: dict[Address, int]           # DictContainer
-    transaction_history: list[str]         # DequeContainer  
-    authorized_minters: set[Address]       # SetContainer
-    
-    @public
-    def initialize(self, ctx: Context, owner: Address) -> None:
-        # ✅ CORRECT: Initialize all containers
-        self.balances = {}                 # Empty DictContainer
-        self.transaction_history = []      # Empty DequeContainer
-        self.authorized_minters = set()    # Empty SetContainer
-
-        # ✅ ALSO CORRECT: initialize containers with values
-        # self.balances = { owner: 1000 }
-        # self.transaction_history = [f"Contract created by {owner.hex()}"]
-        # self.authorized_minters = {owner}
-```
----
-
-## ⚠️ WHAT WORKS vs WHAT FAILS - SPECIFIC EXAMPLES
-
-### DictContainer: What Works ✅ vs What Fails ❌
-
-```python
-@export
-class ExampleContract(Blueprint):
-    balances: dict[Address, int]  # This is DictContainer!
-    
-    @public
-    def dict_operations(self, ctx: Context) -> None:
-        address = ctx.get_caller_address()
-        
-        # ✅ THESE WORK - Basic dict operations
-        self.balances[address] = 100              # __setitem__
-        balance = self.balances[address]          # __getitem__  
-        balance = self.balances.get(address, 0)   # get() with default
-        exists = address in self.balances         # __contains__
-        del self.balances[address]                # __delitem__
-        length = len(self.balances)               # __len__
-        self.balances.update({addr1: 50, addr2: 75})  # update()
-        
-        # ❌ THESE FAIL - Will raise NotImplementedError or AttributeError
-        keys = self.balances.keys()               # NOT IMPLEMENTED!
-        values = self.balances.values()           # NOT IMPLEMENTED!
-        items = self.balances.items()             # NOT IMPLEMENTED!
-        copy_dict = self.balances.copy()          # NOT IMPLEMENTED!
-        popped = self.balances.pop(address)       # NOT IMPLEMENTED!
-        item = self.balances.popitem()            # NOT IMPLEMENTED!
-        self.balances.clear()                     # NOT IMPLEMENTED!
-        default_val = self.balances.setdefault(address, 0)  # NOT IMPLEMENTED!
-        
-        # ❌ THESE FAIL - Trying to convert to Python dict
-        python_dict = dict(self.balances)         # WILL FAIL!
-        key_list = list(self.balances.keys())     # WILL FAIL!
-        
-        # ✅ WORKAROUNDS - Use supported operations instead
-        # Instead of .keys(), use membership testing:
-        for potential_key in known_addresses:
-            if potential_key in self.balances:
-                value = self.balances[potential_key]
-```
-
-### DequeContainer: What Works ✅ vs What Fails ❌
-
-```python
-@export  
-class ExampleContract(Blueprint):
-    history: list[str]  # This is DequeContainer!
-    
-    @public
-    def list_operations(self, ctx: Context) -> None:
-        # ✅ THESE WORK - Basic sequence operations
-        self.history.append("event")              # append()
-        self.history.extend(["a", "b", "c"])      # extend()
-        item = self.history[0]                    # __getitem__
-        self.history[0] = "new_item"              # __setitem__
-        length = len(self.history)                # __len__
-        
-        # ✅ THESE WORK - Deque-specific operations
-        self.history.appendleft("first")          # appendleft() 
-        self.history.extendleft(["x", "y"])       # extendleft()
-        first = self.history.popleft()            # popleft()
-        last = self.history.pop()                 # pop()
-        self.history.reverse()                    # reverse()
-        
-        # ✅ THESE WORK - Iteration
-        for item in self.history:                 # __iter__
-            pass
-        
-        # ❌ THESE FAIL - Will raise NotImplementedError
-        self.history.insert(1, "item")            # NOT IMPLEMENTED!
-        self.history.remove("item")               # NOT IMPLEMENTED!
-        self.history.sort()                       # NOT IMPLEMENTED!
-        index = self.history.index("item")        # NOT IMPLEMENTED!
-        count = self.history.count("item")        # NOT IMPLEMENTED!
-        copy_list = self.history.copy()           # NOT IMPLEMENTED!
-        
-        # ❌ THESE FAIL - Standard list methods
-        self.history.clear()                      # NOT IMPLEMENTED!
-        
-        # ❌ THESE FAIL - Trying to convert to Python list
-        python_list = list(self.history)          # MAY FAIL!
-        
-        # ✅ WORKAROUNDS - Use supported operations instead
-        # Instead of .index(), iterate manually:
-        for i, item in enumerate(self.history):
-            if item == "target":
-                found_index = i
-                break
-```
-
-### SetContainer: What Works ✅ vs What Fails ❌
-
-```python
-@export
-class ExampleContract(Blueprint):
-    members: set[Address]  # This is SetContainer!
-    
-    @public
-    def set_operations(self, ctx: Context) -> None:
-        address = ctx.get_caller_address()
-        other_addresses = [addr1, addr2, addr3]
-        
-        # ✅ THESE WORK - Basic set operations
-        self.members.add(address)                 # add()
-        self.members.discard(address)             # discard() (no error if missing)
-        self.members.remove(address)              # remove() (raises KeyError if missing)
-        self.members.update(other_addresses)      # update()
-        exists = address in self.members          # __contains__
-        length = len(self.members)                # __len__
-        
-        # ✅ THESE WORK - Some set operations
-        is_empty = self.members.isdisjoint(other_addresses)  # isdisjoint()
-        is_superset = self.members.issuperset(other_addresses)  # issuperset()
-        intersection = self.members.intersection(other_addresses)  # intersection()
-        self.members.difference_update(other_addresses)  # difference_update()
-        
-        # ❌ THESE FAIL - Will raise NotImplementedError  
-        copy_set = self.members.copy()            # NOT IMPLEMENTED!
-        union_set = self.members.union(other_addresses)  # NOT IMPLEMENTED!
-        diff_set = self.members.difference(other_addresses)  # NOT IMPLEMENTED!
-        sym_diff = self.members.symmetric_difference(other_addresses)  # NOT IMPLEMENTED!
-        subset = self.members.issubset(other_addresses)  # NOT IMPLEMENTED!
-        popped = self.members.pop()               # NOT IMPLEMENTED!
-        self.members.clear()                      # NOT IMPLEMENTED!
-        self.members.symmetric_difference_update(other_addresses)  # NOT IMPLEMENTED!
-        self.members.intersection_update(other_addresses)  # NOT IMPLEMENTED!
-        
-        # ❌ THESE FAIL - Set operators
-        union_op = self.members | other_set       # NOT IMPLEMENTED!
-        intersect_op = self.members & other_set   # NOT IMPLEMENTED!
-        diff_op = self.members - other_set        # NOT IMPLEMENTED!
-        
-        # ❌ THESE FAIL - Trying to convert to Python set
-        python_set = set(self.members)            # MAY FAIL!
-        
-        # ✅ WORKAROUNDS - Use supported operations instead
-        # Instead of .union(), add items manually:
-        for item in other_addresses:
-            self.members.add(item)
-```
-
-### Common Failure Patterns
-
-```python
-@export
-class BadExample(Blueprint):
-    data: dict[str, int]
-    items: list[str]  
-    tags: set[str]
-    
-    @public
-    def bad_operations(self, ctx: Context) -> None:
-        # ❌ ALL OF THESE WILL FAIL!
-        
-        # Dict failures
-        for key in self.data.keys():              # FAIL: .keys() not implemented
-            pass
-        all_values = list(self.data.values())     # FAIL: .values() not implemented  
-        dict_copy = self.data.copy()              # FAIL: .copy() not implemented
-        
-        # List failures  
-        self.items.sort()                         # FAIL: .sort() not implemented
-        self.items.insert(0, "first")             # FAIL: .insert() not implemented
-        self.items.remove("item")                 # FAIL: .remove() not implemented
-        
-        # Set failures
-        new_set = self.tags.copy()                # FAIL: .copy() not implemented
-        union_result = self.tags.union({"a"})     # FAIL: .union() not implemented
-        
-        # Conversion failures
-        py_dict = dict(self.data)                 # FAIL: Can't convert to Python dict
-        py_list = list(self.items)                # FAIL: May not work
-        py_set = set(self.tags)                   # FAIL: May not work
-
-@export 
-class GoodExample(Blueprint):
-    data: dict[str, int]
-    items: list[str]
-    tags: set[str]
-    
-    @public
-    def good_operations(self, ctx: Context) -> None:
-        # ✅ ALL OF THESE WORK!
-        
-        # Dict operations
-        self.data["key"] = 100
-        value = self.data.get("key", 0)
-        if "key" in self.data:
-            del self.data["key"]
-        
-        # List operations  
-        self.items.append("new")
-        self.items.appendleft("first")
-        last = self.items.pop()
-        first = self.items.popleft()
-        
-        # Set operations
-        self.tags.add("new_tag")
-        self.tags.discard("old_tag") 
-        if "tag" in self.tags:
-            self.tags.remove("tag")
-```
-
-
-### Decorators Explained
-
-Hathor provides three method decorators with fine-grained permission control:
-
-#### @public - State-Changing Methods
-
-The `@public` decorator marks methods that can modify contract state. These methods:
-- **MUST** have `ctx: Context` as the first parameter (after `self`)
-- Can read and write state
-- Can interact with other contracts
-- Can perform token operations (if allowed)
-
-**Available Parameters**:
-```python
-@public(
-    # Token Actions (individual flags)
-    allow_deposit=True,              # Allow HTR/token deposits
-    allow_withdrawal=True,           # Allow HTR/token withdrawals
-    allow_grant_authority=True,      # Allow granting mint/melt authorities
-    allow_acquire_authority=True,    # Allow acquiring mint/melt authorities
-
-    # OR use allow_actions for multiple types
-    allow_actions=[NCActionType.DEPOSIT, NCActionType.WITHDRAWAL],
-
-    # Reentrancy Control
-    allow_reentrancy=False           # Prevent recursive calls (default: False)
-)
-def my_method(self, ctx: Context, arg1: str) -> int:
-    # Can modify state
-    self.counter += 1
-
-    # Can access context
-    caller = ctx.get_caller_address()
-
-    # Can access actions
-    for action in ctx.actions_list:
-        if isinstance(action, NCDepositAction):
-            # Handle deposit
-            pass
-
-    return self.counter
-```
-
-**Note**: Use either individual flags (`allow_deposit`, `allow_withdrawal`, etc.) OR `allow_actions` list, not both.
-
-#### @view - Read-Only Methods
-
-The `@view` decorator marks methods that can only read state, never modify it:
-- **NO** `ctx` parameter (view methods don't have access to context)
-- Can only read state
-- Cannot call other contracts
-- Cannot modify any fields
-- Will raise `NCViewMethodError` if you try to write
-
-```python
-@view
-def get_balance(self, address: Address) -> int:
-    # NO ctx parameter!
-    # Can only read state, never modify
-    return self.balances.get(address, 0)
-
-@view
-def get_total_supply(self) -> int:
-    return sum(self.balances.values())
-```
-
-#### @fallback - Catch-All Method
-
-The `@fallback` decorator creates a catch-all method for undefined method calls. This is an advanced pattern:
-- Method **MUST** be named `fallback`
-- Has same permission parameters as `@public`
-- Special signature: `def fallback(self, ctx: Context, method_name: str, nc_args: NCArgs)`
-
-```python
-from hathor import NCArgs
-
-@fallback(allow_deposit=True)
-def fallback(self, ctx: Context, method_name: str, nc_args: NCArgs) -> None:
-    # Called when undefined method is invoked
-    # method_name: the name that was called
-    # nc_args: the arguments passed
-
-    if method_name.startswith("custom_"):
-        # Handle custom methods dynamically
-        pass
-    else:
-        raise NCFail(f"Unknown method: {method_name}")
-```
-
-#### Action Types Reference
-
-```python
-from hathor import NCActionType
-
-# Available action types:
-NCActionType.DEPOSIT           # Token deposits into contract
-NCActionType.WITHDRAWAL        # Token withdrawals from contract
-NCActionType.GRANT_AUTHORITY   # Grant mint/melt authority to another contract
-NCActionType.ACQUIRE_AUTHORITY # Acquire mint/melt authority from transaction
-```
-
-### Context Object (ctx)
-
-The `Context` object is passed to all `@public` and `@fallback` methods. It provides **immutable** access to transaction and block data.
-
-#### Properties
-
-```python
-@public
-def example(self, ctx: Context) -> None:
-    # ========== CALLER INFORMATION ==========
-
-    # Caller ID (can be Address or ContractId)
-    caller_id = ctx.caller_id  # Address | ContractId
-
-    # Type-safe caller access
-    caller_addr = ctx.get_caller_address()  # Address or None
-    caller_contract = ctx.get_caller_contract_id()  # ContractId or None
-
-    # Example usage:
-    if caller_addr := ctx.get_caller_address():
-        # Called by a wallet address
-        print(f"User: {caller_addr.hex()}")
-    elif caller_contract := ctx.get_caller_contract_id():
-        # Called by another contract
-        print(f"Contract: {caller_contract.hex()}")
-
-    # ========== ACTIONS (Deposits, Withdrawals, Authorities) ==========
-
-    # All actions as a list
-    all_actions = ctx.actions_list  # Sequence[NCAction]
-
-    # Actions grouped by token UID
-    actions_by_token = ctx.actions  # MappingProxyType[TokenUid, tuple[NCAction, ...]]
-
-    # Get exactly one action for a token (raises NCFail if != 1)
-    single_action = ctx.get_single_action(token_uid)
-
-    # Iterate over all actions
-    for action in ctx.actions_list:
-        if isinstance(action, NCDepositAction):
-            print(f"Deposit: {action.amount} of {action.token_uid.hex()}")
-        elif isinstance(action, NCWithdrawalAction):
-            print(f"Withdrawal: {action.amount} of {action.token_uid.hex()}")
-        elif isinstance(action, NCGrantAuthorityAction):
-            print(f"Grant authority: mint={action.mint}, melt={action.melt}")
-        elif isinstance(action, NCAcquireAuthorityAction):
-            print(f"Acquire authority: mint={action.mint}, melt={action.melt}")
-
-    # ========== VERTEX (Transaction) DATA ==========
-
-    # Transaction hash (unique identifier)
-    tx_hash = ctx.vertex.hash  # bytes (32 bytes)
-
-    # Transaction timestamp (NOT block timestamp!)
-    tx_timestamp = ctx.vertex.timestamp  # int (seconds since epoch)
-
-    # Transaction weight
-    tx_weight = ctx.vertex.weight  # float
-
-    # Transaction nonce
-    tx_nonce = ctx.vertex.nonce  # int
-
-    # Transaction version
-    tx_version = ctx.vertex.version  # TxVersion
-
-    # Transaction inputs (where funds came from)
-    for tx_input in ctx.vertex.inputs:
-        prev_tx_id = tx_input.tx_id  # VertexId
-        output_index = tx_input.index  # int
-        signature_data = tx_input.data  # bytes
-        # Output info (if available)
-        if tx_input.info:
-            value = tx_input.info.value  # int
-            script = tx_input.info.raw_script  # bytes
-            token_data = tx_input.info.token_data  # int
-
-    # Transaction outputs (where funds go)
-    for tx_output in ctx.vertex.outputs:
-        value = tx_output.value  # int (amount)
-        script = tx_output.raw_script  # bytes
-        token_data = tx_output.token_data  # int
-        # Parsed script info (if available)
-        if tx_output.parsed_script:
-            script_type = tx_output.parsed_script.type  # "P2PKH" or "MultiSig"
-            address = tx_output.parsed_script.address  # str (base58)
-            timelock = tx_output.parsed_script.timelock  # int | None
-
-    # Parent transactions
-    parent_txs = ctx.vertex.parents  # tuple[VertexId, ...]
-
-    # Custom tokens involved
-    tokens = ctx.vertex.tokens  # tuple[TokenUid, ...]
-
-    # ========== BLOCK DATA ==========
-
-    # Block timestamp (when transaction was confirmed)
-    block_timestamp = ctx.block.timestamp  # int (seconds since epoch)
-
-    # Block height (blockchain position)
-    block_height = ctx.block.height  # int
-
-    # Block hash
-    block_hash = ctx.block.hash  # VertexId (bytes)
-
-    # ========== DEPRECATED ==========
-
-    # Old property (use ctx.block.timestamp instead)
-    timestamp = ctx.timestamp  # Same as ctx.block.timestamp
-```
-
-#### Common Patterns
-
-```python
-# Pattern 1: Require specific caller
-@public
-def only_owner(self, ctx: Context) -> None:
-    caller = ctx.get_caller_address()
-    if caller != self.owner:
-        raise Unauthorized("Only owner can call this")
-
-# Pattern 2: Check time constraints
-@public
-def before_deadline(self, ctx: Context) -> None:
-    if ctx.block.timestamp > self.deadline:
-        raise TooLate(f"Deadline was {self.deadline}")
-
-# Pattern 3: Handle deposits
-@public(allow_deposit=True)
-def deposit(self, ctx: Context) -> None:
-    action = ctx.get_single_action(self.token_uid)
-    assert isinstance(action, NCDepositAction)
-
-    caller = ctx.get_caller_address()
-    self.balances[caller] = self.balances.get(caller, 0) + action.amount
-
-# Pattern 4: Multi-token handling
-@public(allow_deposit=True)
-def multi_deposit(self, ctx: Context) -> None:
-    caller = ctx.get_caller_address()
-
-    for action in ctx.actions_list:
-        if isinstance(action, NCDepositAction):
-            token_uid = action.token_uid
-            amount = action.amount
-            # Update balance per token
-            key = (caller, token_uid)
-            self.balances[key] = self.balances.get(key, 0) + amount
-```
-
-#### Important Notes
-
-- **Context is immutable**: You cannot modify `ctx` or any of its properties
-- **Block data requires confirmation**: `ctx.block` is only available after the transaction is confirmed in a block
-- **Actions are validated**: The system ensures actions match method permissions before calling your method
-- **Caller identification**: Use `get_caller_address()` / `get_caller_contract_id()` for type-safe access instead of checking `caller_id` directly
-
-### Actions (Deposits & Withdrawals)
-
-```python
-from hathor import (
-    NCDepositAction,
-    NCWithdrawalAction,
-    NCGrantAuthorityAction,
-    NCAcquireAuthorityAction
-)
-
-@public(allow_deposit=True)
-def deposit_tokens(self, ctx: Context) -> None:
-    # Access deposited tokens
-    for action in ctx.actions_list:
-        if isinstance(action, NCDepositAction):
-            token_uid = action.token_uid
-            amount = action.amount
-            # Token is now in contract balance
-
-@public(allow_withdrawal=True)
-def withdraw_tokens(self, ctx: Context, amount: int) -> None:
-    # Withdrawal is declared in the transaction
-    # You just need to validate it's allowed
-    action = ctx.get_single_action(self.token_uid)
-    if action.amount > self.balances[ctx.get_caller_address()]:
-        raise NCFail("Insufficient balance")
-    # Withdrawal happens automatically
-```
-
-### Storage and State Management
-
-State is automatically persisted in a Merkle Patricia Trie:
-
-```python
-class TokenContract(Blueprint):
-    balances: dict[Address, int]  # Stored in trie
-    total_supply: int              # Stored in trie
-
-    @public
-    def transfer(self, ctx: Context, to: Address, amount: int) -> None:
-        from_addr = ctx.get_caller_address()
-
-        # Read from storage
-        from_balance = self.balances.get(from_addr, 0)
-
-        # Validate
-        if from_balance < amount:
-            raise InsufficientBalance()
-
-        # Update storage (automatically persisted)
-        self.balances[from_addr] = from_balance - amount
-        self.balances[to] = self.balances.get(to, 0) + amount
-```
-
-### Error Handling
-
-```python
-from hathor import NCFail
-
-# Define custom errors
-class InsufficientBalance(NCFail):
-    pass
-
-class Unauthorized(NCFail):
-    pass
-
-class InvalidAmount(NCFail):
-    pass
-
-# Use in methods
-@public
-def withdraw(self, ctx: Context, amount: int) -> None:
-    if amount <= 0:
-        raise InvalidAmount("Amount must be positive")
-
-    balance = self.balances.get(ctx.get_caller_address(), 0)
-    if balance < amount:
-        raise InsufficientBalance(f"Balance: {balance}, requested: {amount}")
-```
-
-## Advanced Features (self.syscall)
-
-The `self.syscall` object provides access to powerful system operations. Use these for advanced contract patterns:
-
-### Contract Interactions
-
-```python
-# Call another contract's public method
-result = self.syscall.call_public_method(
-    nc_id=other_contract_id,
-    method_name="transfer",
-    actions=[],  # Optional actions to pass
-    from_addr=ctx.get_caller_address(),
-    to_addr=recipient,
-    amount=100
-)
-
-# Call another contract's view method (read-only)
-balance = self.syscall.call_view_method(
-    nc_id=other_contract_id,
-    method_name="get_balance",
-    address=some_address
-)
-
-# Proxy call (delegatecall pattern - runs blueprint code with current contract's state)
-result = self.syscall.proxy_call_public_method(
-    blueprint_id=other_blueprint_id,
-    method_name="method_name",
-    actions=[],
-    arg1, arg2
-)
-```
-
-### Token Creation & Management
-
-```python
-# Create a new token
-token_uid = self.syscall.create_token(
-    token_name="MyToken",
-    token_symbol="MTK",
-    amount=1000,              # Initial supply (goes to contract)
-    mint_authority=True,      # Contract can mint more
-    melt_authority=True       # Contract can melt (burn)
-)
-
-# Mint tokens (requires mint authority)
-self.syscall.mint_tokens(
-    token_uid=token_uid,
-    amount=500
-)
-
-# Melt tokens (requires melt authority)
-self.syscall.melt_tokens(
-    token_uid=token_uid,
-    amount=200
-)
-
-# Revoke authorities (cannot be undone!)
-self.syscall.revoke_authorities(
-    token_uid=token_uid,
-    revoke_mint=True,
-    revoke_melt=False
-)
-```
-
-### Balance & Authority Queries
-
-```python
-# Get current contract ID
-contract_id = self.syscall.get_contract_id()
-
-# Get blueprint ID
-blueprint_id = self.syscall.get_blueprint_id()
-other_blueprint = self.syscall.get_blueprint_id(contract_id=other_contract_id)
-
-# Get balance (includes current call's actions)
-balance = self.syscall.get_current_balance(
-    token_uid=token_uid,
-    contract_id=None  # None = current contract
-)
-
-# Get balance before current call (excludes current actions)
-balance_before = self.syscall.get_balance_before_current_call(
-    token_uid=token_uid
-)
-
-# Check mint/melt authority
-can_mint = self.syscall.can_mint(token_uid)
-can_melt = self.syscall.can_melt(token_uid)
-
-# Check authority before current call
-can_mint_before = self.syscall.can_mint_before_current_call(token_uid)
-can_melt_before = self.syscall.can_melt_before_current_call(token_uid)
-```
-
-### Contract Creation
-
-```python
-# Create a child contract
-new_contract_id, init_result = self.syscall.create_contract(
-    blueprint_id=child_blueprint_id,
-    salt=b"unique_salt",  # For deterministic addresses
-    actions=[],           # Optional initial actions
-    initial_value=100     # Constructor arguments
-)
-```
-
-### Events & Upgrades
-
-```python
-# Emit custom event
-self.syscall.emit_event(b"Transfer successful")
-
-# Upgrade contract blueprint (advanced!)
-self.syscall.change_blueprint(new_blueprint_id)
-```
-
-### Random Number Generation (self.syscall.rng)
-
-**Unique Hathor Feature**: Hathor provides a **built-in deterministic RNG syscall** using ChaCha20 encryption. This is accessed via `self.syscall.rng` - a blockchain-native randomness source!
-
-#### How It Works
+class BatchChatRequest(BaseModel):
+    """Independent chat requests answered together"""
+    items: List[ChatRequest] = Field(min_length=1, max_length=16)
 
-1. **Transaction Seed**: Each transaction has a unique seed
-2. **Per-Contract Derivation**: Each contract gets its own RNG derived from the transaction seed
-3. **Deterministic**: Same transaction → same random sequence (consensus guaranteed)
-4. **ChaCha20**: Uses cryptographically strong ChaCha20 stream cipher
 
-```python
-# Access the RNG (syscall - not a library import!)
-rng = self.syscall.rng  # Returns: NanoRNG instance unique to this contract
+class BatchChatResponse(BaseModel):
+    """Responses to a batch chat request, in request order"""
+    items: List[ChatResponse]
 
-# ========== BASIC METHODS ==========
 
-# Random bytes
-random_bytes = rng.randbytes(32)  # Returns: bytes of specified size
-random_hash = rng.randbytes(32)   # Perfect for generating IDs
+# Caps the provider calls made concurrently on behalf of batch requests
+batch_semaphore = asyncio.Semaphore(
+    int(os.getenv("AI_BATCH_CONCURRENCY", "32")))
 
-# Random integer in range [a, b] (inclusive on both ends!)
-dice_roll = rng.randint(1, 6)     # Returns: 1, 2, 3, 4, 5, or 6
-percent = rng.randint(0, 100)     # Returns: 0 to 100
 
-# Random float in range [0, 1)
-probability = rng.random()         # Returns: 0.0 <= value < 1.0
-
-# ========== ADVANCED METHODS ==========
-
-# Random integer with specific bit length
-big_number = rng.randbits(256)    # Returns: 0 <= n < 2**256
-
-# Random integer in range [0, n) (exclusive upper bound!)
-index = rng.randbelow(10)         # Returns: 0 to 9
-
-# Random integer in range [start, stop) with step
-even_number = rng.randrange(0, 100, 2)  # Returns: 0, 2, 4, ..., 98
+class ResponseCache:
+    """
+    Bounded LRU cache of chat responses keyed by the prompt sent, backed
+    by Redis when available so entries are shared between workers.
+    """
 
-# Choose random element from sequence
-winner = rng.choice(["Alice", "Bob", "Charlie"])
-card = rng.choice([1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 11, 12, 13])
+    def __init__(self):
+        self.responses: OrderedDict[str, ChatResponse] = OrderedDict()
+        self.max_size = int(os.getenv("AI_RESPONSE_CACHE_SIZE", "256"))
+        self.ttl = int(os.getenv("AI_RESPONSE_CACHE_TTL", "3600"))
+        self.redis = get_redis_connection() if self.max_size > 0 else None
+
+    @staticmethod
+    def make_key(prompt: str, request: ChatRequest) -> str:
+        """
+        Hash the user prompt into a fixed-size cache key. The static system
+        prompt is folded in through its precomputed hash, never rehashed.
+        The response also depends on request fields the prompt may leave
+        out or truncate: the current file becomes original_code and the
+        full execution logs feed the suggestions, so both are hashed too.
+        The provider and model are hashed so answers from a previously
+        configured model are never served.
+        """
+        provider = ai_settings.provider
+        key = hashlib.blake2b(
+            digest_size=16,
+            person=HATHOR_SYSTEM_PROMPT_HASH.encode()
+        )
+        for part in (
+            provider,
+            AI_MODEL_NAMES.get(provider),
+            prompt,
+            request.current_file_content,
+            request.execution_logs
+        ):
+            # Length-prefix each part so different splits never collide
+            data = b"" if part is None else part.encode()
+            key.update(f"{-1 if part is None else len(data)}:".encode())
+            key.update(data)
+        return key.hexdigest()
+
+    async def get(self, key: str) -> Optional[ChatResponse]:
+        """Return the cached response for key, if any"""
+        response = self.responses.get(key)
+        if response is not None:
+            self.responses.move_to_end(key)
+            return response
+
+        if self.redis:
+            try:
+                data = await self.redis.get(f"ai:response:{key}")
+            except Exception as e:
+                logger.warning("Response cache lookup failed", error=str(e))
+                return None
+            if data:
+                try:
+                    response = ChatResponse.model_validate_json(data)
+                except ValidationError as e:
+                    # Entries written before a schema change are misses
+                    logger.warning("Stale cached response", error=str(e))
+                    return None
+                self.remember(key, response)
+        return response
+
+    async def set(self, key: str, response: ChatResponse):
+        """Store a response in memory and, if available, in Redis"""
+        if self.max_size <= 0:
+            return
+        self.remember(key, response)
+
+        if self.redis:
+            try:
+                await self.redis.set(
+                    f"ai:response:{key}",
+                    response.model_dump_json(),
+                    ex=self.ttl
+                )
+            except Exception as e:
+                logger.warning("Response cache store failed", error=str(e))
+
+    def remember(self, key: str, response: ChatResponse):
+        """Keep a response in memory, evicting the least recently used"""
+        self.responses[key] = response
+        self.responses.move_to_end(key)
+        while len(self.responses) > self.max_size:
+            self.responses.popitem(last=False)
+
+
+response_cache = ResponseCache()
+
+# AI calls currently running, keyed like the response cache, so identical
+# concurrent requests share one provider call
+inflight_requests: Dict[str, "asyncio.Task[ChatResponse]"] = {}
+# Strong references to fire-and-forget tasks until they finish
+background_tasks: set[asyncio.Task] = set()
+
+
+def forget_background_task(task: asyncio.Task):
+    """Drop a finished background task, logging it if it failed"""
+    background_tasks.discard(task)
+    if not task.cancelled() and task.exception() is not None:
+        logger.error(
+            "Background task failed", error=str(task.exception()))
 
-# ========== SEED ACCESS ==========
 
-# Get the seed used (read-only)
-seed = rng.seed  # bytes (32 bytes)
-```
+class ChatSessionStore:
+    """
+    Bounded LRU store of the recent conversation history per session.
+    Session ids are random tokens issued by the server and bound to the
+    client that started the session, so ids picked by clients, or sent
+    from another client, never read stored history.
+    """
 
-#### Real-World Example: Dice Game (from Hathor Labs)
+    def __init__(self):
+        # session id -> (client ip, history)
+        self.sessions: OrderedDict[
+            str, Tuple[str, deque[ChatMessage]]] = OrderedDict()
+        self.max_sessions = int(os.getenv("AI_MAX_CHAT_SESSIONS", "1024"))
+        self.max_messages = int(os.getenv("AI_SESSION_HISTORY_SIZE", "20"))
 
-```python
-from hathor import (
-    Blueprint, public, view, Context, export,
-    NCFail, Amount, CallerId
-)
+    def get_history(
+        self,
+        session_id: str,
+        client_ip: str
+    ) -> List[ChatMessage]:
+        """Return a client's stored history for a session, oldest first"""
+        session = self.sessions.get(session_id)
+        if session is None or session[0] != client_ip:
+            return []
+        self.sessions.move_to_end(session_id)
+        return list(session[1])
+
+    def add_turn(
+        self,
+        session_id: Optional[str],
+        client_ip: str,
+        message: str,
+        reply: str
+    ) -> str:
+        """
+        Record a user message and the assistant reply. Starts a new session
+        unless session_id is a live session of this client, and returns
+        the id of the session the turn was recorded in.
+        """
+        session = self.sessions.get(session_id) if session_id else None
+        if session is None or session[0] != client_ip:
+            session_id = secrets.token_urlsafe(32)
+            session = (client_ip, deque(maxlen=self.max_messages))
+            self.sessions[session_id] = session
+        self.sessions.move_to_end(session_id)
+        session[1].append(ChatMessage(role="user", content=message))
+        session[1].append(ChatMessage(role="assistant", content=reply))
+        while len(self.sessions) > self.max_sessions:
+            self.sessions.popitem(last=False)
+        return session_id
+
+
+session_store = ChatSessionStore()
+
+
+# Hathor-specific system prompt, kept in its own file. It is sent unchanged
+# with every request so providers can serve it from their prompt cache; any
+# edit invalidates it.
+SYSTEM_PROMPT_PATH = Path(__file__).parent / "prompts" / \
+    "hathor_system_prompt.md"
+HATHOR_SYSTEM_PROMPT = SYSTEM_PROMPT_PATH.read_text(encoding="utf-8")
+
+# Identifies the current system prompt version in provider prompt caches
+HATHOR_SYSTEM_PROMPT_HASH = hashlib.sha256(
+    HATHOR_SYSTEM_PROMPT.encode()).hexdigest()[:16]
+
+
+def get_ai_agent() -> Agent:
+    """Get the shared AI agent for the configured provider"""
+    return build_ai_agent(*get_ai_config())
+
+
+@lru_cache(maxsize=4)
+def build_ai_agent(provider: str, api_key: str) -> Agent:
+    """Build the AI agent for a provider configuration, once per process"""
+    return Agent(
+        model=build_ai_model(provider, api_key),
+        system_prompt=HATHOR_SYSTEM_PROMPT,
+        # OpenAI and Gemini both cache long identical prompt prefixes
+        # implicitly. Route requests sharing the system prompt to the same
+        # OpenAI prompt cache; other providers ignore this setting
+        model_settings={
+            "openai_prompt_cache_key":
+                f"hathor-system-prompt-{HATHOR_SYSTEM_PROMPT_HASH}"
+        }
+    )
+
+
+@lru_cache(maxsize=8)
+def build_mock_response(error: str) -> ChatResponse:
+    """
+    Response returned when no AI provider is configured. Configuration
+    errors come from a handful of messages, so responses are shared.
+    """
+    return ChatResponse(
+        success=True,
+        message=(
+            "Hi! I'm Clippy, your Hathor Nano Contracts "
+            "assistant! 📎\n\n"
+            "I'd love to help you with your nano contracts, but I "
+            "need an AI provider API key to be fully functional. "
+            "For now, here are some quick tips:\n\n"
+            "• Always use @public for state-changing methods\n"
+            "• Use @view for read-only methods\n"
+            "• Include type hints for all variables\n"
+            "• Use @export decorator on your class\n\n"
+            f"Error: {error}"
+        ),
+        suggestions=[
+            "Add proper type hints to your contract",
+            "Use @public decorator for state-changing methods",
+            "Check the initialize method implementation",
+            "Validate user inputs in your methods"
+        ]
+    )
+
+
+def build_error_response(error: Exception) -> ChatResponse:
+    """Response returned when the AI assistant fails"""
+    return ChatResponse(
+        success=False,
+        error=f"Assistant unavailable: {str(error)}",
+        message=(
+            "Sorry, I'm having trouble right now! 😅 But here "
+            "are some general tips:\n\n"
+            "• Make sure your contract inherits from Blueprint\n"
+            "• Use proper decorators (@public/@view)\n"
+            "• Include the initialize method\n"
+            "• Use @export decorator on your class"
+        ),
+        suggestions=[
+            "Check Hathor nano contracts documentation",
+            "Review the example contracts",
+            "Ensure proper Python syntax"
+        ]
+    )
 
-@export
-class HathorDice(Blueprint):
-    \\\"\\\"\\\"Production dice game using self.syscall.rng for on-chain randomness.\\\"\\\"\\\"
-
-    token_uid: TokenUid
-    max_bet_amount: Amount
-    house_edge_basis_points: int  # 50 = 0.50%
-    random_bit_length: int  # e.g., 32 for 2^32 range
-
-    balances: dict[CallerId, int]
-    available_tokens: Amount
-
-    @public
-    def initialize(self, ctx: Context, token_uid: TokenUid,
-                   house_edge_basis_points: int, max_bet_amount: Amount,
-                   random_bit_length: int) -> None:
-        if random_bit_length < 16 or random_bit_length > 32:
-            raise NCFail('random bit length must be 16-32')
-
-        # Initialize all declared attributes
-        self.balances = {}
-        self.token_uid = token_uid
-        self.house_edge_basis_points = house_edge_basis_points
-        self.max_bet_amount = max_bet_amount
-        self.random_bit_length = random_bit_length
-        self.available_tokens = 0
-
-    @public(allow_deposit=True)
-    def place_bet(self, ctx: Context, bet_amount: Amount, threshold: int) -> int:
-        \\\"\\\"\\\"
-        Player bets that lucky_number < threshold.
-
-        Args:
-            bet_amount: Amount to wager
-            threshold: Win if random number is below this (0 to 2^random_bit_length)
-
-        Returns:
-            Payout amount (0 if lost)
-        \\\"\\\"\\\"
-        if bet_amount > self.max_bet_amount:
-            raise NCFail('bet amount too high')
-
-        # Generate random number using syscall RNG
-        lucky_number = self.syscall.rng.randbits(self.random_bit_length)
-
-        if lucky_number >= threshold:
-            # Lose - house keeps the bet
-            self.available_tokens += bet_amount
-            self.syscall.emit_event(f'{{"result": "lose", "number": {lucky_number}}}'.encode())
-            return 0
-
-        # Win - calculate payout with house edge
-        payout = self.calculate_payout(bet_amount, threshold)
-
-        if payout > self.available_tokens:
-            raise NCFail('not enough liquidity')
-
-        self.available_tokens -= (payout - bet_amount)
-        self.balances[ctx.caller_id] = self.balances.get(ctx.caller_id, 0) + payout
-
-        self.syscall.emit_event(f'{{"result": "win", "payout": {payout}}}'.encode())
-        return payout
-
-    @view
-    def calculate_payout(self, bet_amount: Amount, threshold: int) -> int:
-        \\\"\\\"\\\"Calculate payout with house edge applied.\\\"\\\"\\\"
-        # fair_odds = 2^bits / threshold
-        # adjusted_odds = fair_odds * (1 - house_edge)
-        numerator = bet_amount * (2**self.random_bit_length) * (10_000 - self.house_edge_basis_points)
-        denominator = 10_000 * threshold
-        return numerator // denominator
-
-```
-
-**Key Points from This Example**:
-- Uses `self.syscall.rng.randbits()` for on-chain randomness
-- No external oracle needed
-- House edge applied to payouts
-- Emits events for game results
-- Production-ready pattern from Hathor Labs
-
-#### Important Notes
-
-**Why This is Special** 🌟:
-- **Built into the blockchain**: Not a library - it's a syscall!
-- **Per-contract isolation**: Each contract gets its own RNG instance
-- **Consensus-safe**: All nodes produce identical random numbers
-- **ChaCha20-based**: Cryptographically strong stream cipher
-- **No external oracles needed**: Randomness is on-chain!
-
-**Determinism**:
-- The RNG is **deterministic**: Same transaction seed → same random sequence
-- Each contract's RNG is **derived** from the transaction seed using the contract ID
-- All nodes will generate **identical** random numbers
-- This ensures **consensus** across the network
-- Formula: `contract_rng = NanoRNG(seed=transaction_rng.randbytes(32))`
-
-**Security Considerations**:
-- ✅ **Good for**: Game logic, lotteries, random selection, shuffling, dice rolls
-- ❌ **NOT for**: Cryptographic keys, signatures, secret generation
-- ⚠️ **Predictability**: Transaction creator can influence the seed by choosing transaction inputs
-- 🎲 **On-chain randomness**: No need for external oracles (like Chainlink VRF)
-
-**Best Practices**:
-```python
-# ✅ GOOD: Use for game mechanics
-winner = rng.choice(players)
-damage = rng.randint(10, 20)
-
-# ✅ GOOD: Use for fair random selection (if seed cannot be manipulated)
-lottery_winner = rng.randbelow(len(participants))
-
-# ❌ BAD: Don't use for security-critical operations
-private_key = rng.randbytes(32)  # INSECURE!
-
-# ⚠️ CAREFUL: User can influence seed by choosing inputs
-# Consider using commit-reveal schemes for high-stakes randomness
-```
-
-**Commit-Reveal Pattern** (for unbiasable randomness):
-```python
-from hathor import Blueprint, public, Context, NCFail, Address, sha3
-
-class UnbiasableLottery(Blueprint):
-    commitments: dict[Address, bytes]  # Hash of secret
-    reveals: dict[Address, bytes]      # Revealed secret
-
-    @public
-    def commit(self, ctx: Context, commitment: bytes) -> None:
-        # Step 1: Users commit hash of their secret
-        caller = ctx.get_caller_address()
-        self.commitments[caller] = commitment
-
-    @public
-    def reveal(self, ctx: Context, secret: bytes) -> None:
-        # Step 2: Users reveal their secret
-        caller = ctx.get_caller_address()
-        # Note: In real Hathor contracts, use self.syscall.sha3() for hashing
-        if sha3(secret) != self.commitments[caller]:
-            raise NCFail("Invalid reveal")
-        self.reveals[caller] = secret
-
-    @public
-    def draw(self, ctx: Context) -> None:
-        # Step 3: Combine all secrets to create unbiased seed
-        combined = b"".join(self.reveals.values())
-        # Note: In real Hathor contracts, use sha3() for hashing
-        seed = sha3(combined)
-
-        # Use combined seed for RNG (more complex implementation needed)
-        # This prevents any single party from biasing the result
-```
-
----
-
-## 🧪 TESTING BLUEPRINTS
-
-### Test File Structure
-
-```python
-from hathor import (
-    Blueprint, public, view, Context, export,
-    Address, TokenUid, NCDepositAction, NCWithdrawalAction
-)
-from hathor import make_nc_type_for_arg_type as make_nc_type
-from tests.nanocontracts.blueprints.unittest import BlueprintTestCase
 
-# Type helpers for storage assertions
-INT_NC_TYPE = make_nc_type(int)
-STR_NC_TYPE = make_nc_type(str)
+# Closes one console message and opens the next
+CONSOLE_MESSAGE_SEPARATOR = "</message>\n<message>"
 
-class MyBlueprintTest(BlueprintTestCase):
-    def setUp(self) -> None:
-        super().setUp()
-        # Register blueprint
-        self.blueprint_id = self._register_blueprint_class(MyBlueprint)
-        # Generate test data
-        self.token_uid = self.gen_random_token_uid()
-        self.address = self.gen_random_address()
-
-    def test_initialize(self) -> None:
-        nc_id = self.gen_random_contract_id()
-        ctx = self.create_context()
-
-        # Create contract
-        self.runner.create_contract(nc_id, self.blueprint_id, ctx, initial_value)
-
-        # Verify state
-        storage = self.runner.get_storage(nc_id)
-        self.assertEqual(storage.get_obj(b'field_name', INT_NC_TYPE), expected_value)
-
-    def test_public_method(self) -> None:
-        # ... setup contract ...
-
-        # Call public method
-        ctx = self.create_context()
-        self.runner.call_public_method(nc_id, 'method_name', ctx, arg1, arg2)
-
-        # Verify state changed
-        storage = self.runner.get_storage(nc_id)
-        self.assertEqual(storage.get_obj(b'counter', INT_NC_TYPE), 1)
-
-    def test_view_method(self) -> None:
-        # View methods don't need context
-        result = self.runner.call_view_method(nc_id, 'get_value')
-        self.assertEqual(result, expected_value)
-
-    def test_deposit(self) -> None:
-        actions = [NCDepositAction(token_uid=self.token_uid, amount=100)]
-        ctx = self.create_context(actions)
-        self.runner.call_public_method(nc_id, 'deposit', ctx)
-
-        # Verify balance
-        storage = self.runner.get_storage(nc_id)
-        balance = storage.get_balance(self.token_uid)
-        self.assertEqual(balance.value, 100)
-
-    def test_error_handling(self) -> None:
-        with self.assertRaises(CustomError):
-            self.runner.call_public_method(nc_id, 'failing_method', ctx)
-
-        # Verify state was NOT changed (rollback)
-        storage = self.runner.get_storage(nc_id)
-        self.assertEqual(storage.get_obj(b'counter', INT_NC_TYPE), original_value)
-```
-
-### Testing Best Practices
-
-1. **Test initialization**: Verify initial state is correct
-2. **Test state changes**: Confirm @public methods update storage
-3. **Test view methods**: Ensure read-only methods work
-4. **Test deposits/withdrawals**: Verify token operations
-5. **Test error cases**: Use assertRaises for NCFail errors
-6. **Test edge cases**: Zero amounts, empty dicts, None values
-7. **Verify rollback**: Failed txs don't change state
-
----
-
-## 📖 COMPLETE WORKING EXAMPLES
-
-### Example 1: Simple Counter Blueprint
-
-```python
-from hathor import Blueprint, public, view, Context, export
-
-@export
-class Counter(Blueprint):
-    count: int
-
-    @public
-    def initialize(self, ctx: Context, initial: int) -> None:
-        self.count = initial
-
-    @public
-    def increment(self, ctx: Context) -> None:
-        self.count += 1
-
-    @public
-    def decrement(self, ctx: Context) -> None:
-        self.count -= 1
-
-    @view
-    def get_count(self) -> int:
-        return self.count
-```
-
-### Example 1b: Counter with Container Usage
-
-```python
-from hathor import Blueprint, public, view, Context, export, Address
-from typing import Optional
-
-@export  
-class CounterWithHistory(Blueprint):
-    count: int
-    # DequeContainer - behaves like deque, not list
-    history: list[str]
-    # DictContainer - specialized blockchain dict
-    user_counts: dict[Address, int]
-    # SetContainer - specialized blockchain set
-    authorized_users: set[Address]
-
-    @public
-    def initialize(self, ctx: Context, initial: int) -> None:
-        self.count = initial
-        # Initialize all containers (required!)
-        self.history = []                    # Empty DequeContainer
-        self.user_counts = {}               # Empty DictContainer
-        self.authorized_users = set()       # Empty SetContainer
-
-    @public
-    def increment(self, ctx: Context) -> None:
-        caller = ctx.get_caller_address()
-        if caller not in self.authorized_users:
-            self.authorized_users.add(caller)  # SetContainer.add()
-        
-        self.count += 1
-        
-        # DequeContainer operations (deque-like, not list-like)
-        self.history.append(f"Count incremented to {self.count}")
-        
-        # DictContainer operations
-        self.user_counts[caller] = self.user_counts.get(caller, 0) + 1
-
-    @view
-    def get_user_increment_count(self, user: Address) -> int:
-        # DictContainer.get() works like dict.get()
-        return self.user_counts.get(user, 0)
-    
-    @view
-    def is_authorized(self, user: Address) -> bool:
-        # SetContainer membership testing
-        return user in self.authorized_users
-```
-
-**Test File** (`/tests/test_counter.py`):
-```python
-from hathor import make_nc_type_for_arg_type as make_nc_type
-from tests.nanocontracts.blueprints.unittest import BlueprintTestCase
-
-INT_NC_TYPE = make_nc_type(int)
-
-class CounterTest(BlueprintTestCase):
-    def setUp(self) -> None:
-        super().setUp()
-        from Counter import Counter
-        self.blueprint_id = self._register_blueprint_class(Counter)
-
-    def test_counter(self) -> None:
-        nc_id = self.gen_random_contract_id()
-        ctx = self.create_context()
-
-        # Initialize with 0
-        self.runner.create_contract(nc_id, self.blueprint_id, ctx, 0)
-        storage = self.runner.get_storage(nc_id)
-        self.assertEqual(storage.get_obj(b'count', INT_NC_TYPE), 0)
-
-        # Increment
-        self.runner.call_public_method(nc_id, 'increment', ctx)
-        self.assertEqual(storage.get_obj(b'count', INT_NC_TYPE), 1)
-
-        # View method
-        result = self.runner.call_view_method(nc_id, 'get_count')
-        self.assertEqual(result, 1)
-```
-
-### Example 2: Token Betting Contract
-
-```python
-from typing import Optional
-from hathor import (
-    Blueprint, public, view, Context, export,
-    Address, TokenUid, NCDepositAction, NCWithdrawalAction,
-    SignedData, TxOutputScript, NCFail
-)
 
-class InvalidToken(NCFail):
-    pass
+def build_conversation_context(request: ChatRequest, client_ip: str) -> str:
+    """Build the user prompt sent to the AI for a chat request"""
+    # Prepare the request context for the AI. It is sent with the user
+    # prompt so the system prompt stays identical across requests and
+    # the provider can reuse its cached prefix.
+    context_parts = []
 
-class TooLate(NCFail):
-    pass
+    # Add current file context if available using XML structure
+    if request.current_file_content and request.current_file_name:
+        context_parts.append(
+            f"<current_file name=\"{request.current_file_name}\">\n"
+            f"{request.current_file_content}\n"
+            f"</current_file>"
+        )
 
-class ResultNotAvailable(NCFail):
-    pass
+    # Add console messages if available using XML structure, wrapping
+    # the last 5 messages with a single join
+    if request.console_messages:
+        messages_xml = CONSOLE_MESSAGE_SEPARATOR.join(
+            request.console_messages[-5:])
+        context_parts.append(
+            f"<console_messages>\n<message>{messages_xml}</message>\n"
+            f"</console_messages>"
+        )
 
-@export
-class Bet(Blueprint):
-    # Total bets per result (DictContainer, not Python dict)
-    bets_total: dict[str, int]
+    # Add execution logs from Pyodide if available using XML structure
+    execution_logs = request.execution_logs
+    if execution_logs and len(execution_logs) > MAX_EXECUTION_LOG_CHARS:
+        context_parts.append(
+            "<execution_logs>\n... (earlier logs truncated)\n"
+            f"{execution_logs[-MAX_EXECUTION_LOG_CHARS:]}\n</execution_logs>"
+        )
+    elif execution_logs:
+        context_parts.append(
+            f"<execution_logs>\n{execution_logs}\n</execution_logs>"
+        )
 
-    # Bets per (result, address) (DictContainer with tuple keys)
-    bets_address: dict[tuple[str, Address], int]
+    # Add any additional context, serialized with a stable key order so
+    # identical context always produces an identical prompt
+    if request.context:
+        context_parts.append(
+            "ADDITIONAL CONTEXT: "
+            f"{json.dumps(request.context, sort_keys=True, default=str)}"
+        )
 
-    # Withdrawals per address (DictContainer)
-    withdrawals: dict[Address, int]
+    # Prefer the history kept for the client's session, falling back to
+    # the history the client sent when the server has none (e.g. after a
+    # restart or once the session was evicted)
+    history = []
+    if request.session_id:
+        history = session_store.get_history(request.session_id, client_ip)
+    if not history:
+        history = request.conversation_history
 
-    # Total pool
-    total: int
+    # Add recent conversation history (limit to last 6 messages)
+    context_parts.extend(f"{msg.role}: {msg.content}" for msg in history[-6:])
 
-    # Final result (None until set)
-    final_result: Optional[str]
+    # Add current message
+    context_parts.append(f"user: {request.message}")
 
-    # Oracle script to verify result
-    oracle_script: TxOutputScript
+    # Create conversation context in a single join
+    return "\n\n".join(context_parts)
 
-    # Deadline for bets
-    date_last_bet: int
 
-    # Token for betting
-    token_uid: TokenUid
+def get_client_ip(http_request: Request) -> str:
+    """
+    Get the client IP, preferring the first X-Forwarded-For entry. Used to
+    log requests and bind chat sessions; rate limits use
+    get_rate_limit_key.
+    """
+    forwarded_for = http_request.headers.get("x-forwarded-for")
+    if forwarded_for:
+        return forwarded_for.partition(",")[0].strip()
+    return http_request.client.host
 
-    @public
-    def initialize(
-        self,
-        ctx: Context,
-        oracle_script: TxOutputScript,
-        token_uid: TokenUid,
-        date_last_bet: int
-    ) -> None:
-        # Initialize all declared attributes
-        self.bets_total = {}
-        self.bets_address = {}
-        self.withdrawals = {}
-        self.oracle_script = oracle_script
-        self.token_uid = token_uid
-        self.date_last_bet = date_last_bet
-        self.final_result = None
-        self.total = 0
-
-    @public(allow_deposit=True)
-    def bet(self, ctx: Context, address: Address, score: str) -> None:
-        # Get the deposit action
-        if self.token_uid not in ctx.actions:
-            raise InvalidToken(f"Expected token {self.token_uid.hex()}")
-
-        action = ctx.get_single_action(self.token_uid)
-        if not isinstance(action, NCDepositAction):
-            raise NCFail("Expected deposit action")
-
-        # Check deadline
-        if ctx.block.timestamp > self.date_last_bet:
-            raise TooLate(f"Deadline was {self.date_last_bet}")
-
-        # Check result not set
-        if self.final_result is not None:
-            raise NCFail("Betting closed, result already set")
-
-        amount = action.amount
-        self.total += amount
-
-        # Update totals
-        if score not in self.bets_total:
-            self.bets_total[score] = amount
-        else:
-            self.bets_total[score] += amount
 
-        # Update address bets
-        key = (score, address)
-        if key not in self.bets_address:
-            self.bets_address[key] = amount
-        else:
-            self.bets_address[key] += amount
+def get_pre_charged_tokens(http_request: Request) -> List[int]:
+    """
+    Tokens the token limit middleware pre-charged for each chat request of
+    the body, empty when it charged nothing
+    """
+    return getattr(http_request.state, "pre_charged_tokens", [])
 
-    @public
-    def set_result(self, ctx: Context, result: SignedData[str]) -> None:
-        # Verify oracle signature
-        if not result.checksig(self.syscall.get_contract_id(), self.oracle_script):
-            raise NCFail("Invalid oracle signature")
 
-        self.final_result = result.data
+def settle_token_usage(
+    rate_limit_key: str,
+    pre_charged_tokens: int,
+    charged_tokens: int
+):
+    """
+    Settle the tokens charged for a request with what the token limit
+    middleware pre-charged for it, skipping negligible corrections
+    """
+    adjustment = charged_tokens - pre_charged_tokens
+    if abs(adjustment) > 50:
+        # The response doesn't wait for the rate limiter update
+        task = asyncio.create_task(
+            token_tracker.consume_tokens(rate_limit_key, adjustment))
+        background_tasks.add(task)
+        task.add_done_callback(forget_background_task)
+
+
+async def record_token_usage(
+    result: Any,
+    rate_limit_key: str,
+    pre_charged_tokens: int
+):
+    """Log token usage for rate limiting and cost tracking"""
+    usage_info = getattr(result, 'usage', None)
+    # pydantic-ai 1.x exposes usage() as a method, later versions as a
+    # property
+    if callable(usage_info):
+        usage_info = usage_info()
+    if usage_info:
+        total_tokens = usage_info.total_tokens
+        input_tokens = usage_info.input_tokens
+        output_tokens = usage_info.output_tokens
+        # Input tokens served from the provider's prompt cache
+        cached_tokens = usage_info.cache_read_tokens
+
+        # Cached input tokens only count for a fraction of their number
+        charged_tokens = total_tokens - cached_tokens + int(
+            cached_tokens * token_tracker.cached_token_weight)
+        settle_token_usage(rate_limit_key, pre_charged_tokens, charged_tokens)
 
-    @public(allow_withdrawal=True)
-    def withdraw(self, ctx: Context) -> None:
-        if self.final_result is None:
-            raise ResultNotAvailable()
+        logger.info(
+            "AI request completed",
+            provider=ai_settings.provider,
+            input_tokens=input_tokens,
+            output_tokens=output_tokens,
+            total_tokens=total_tokens,
+            cached_tokens=cached_tokens,
+            charged_tokens=charged_tokens,
+            pre_charged_tokens=pre_charged_tokens,
+            rate_limit_key=rate_limit_key
+        )
 
-        action = ctx.get_single_action(self.token_uid)
-        if not isinstance(action, NCWithdrawalAction):
-            raise NCFail("Expected withdrawal action")
 
-        caller = ctx.get_caller_address()
-        assert caller is not None
+def build_suggestions(request: ChatRequest) -> List[str]:
+    """Generate helpful suggestions based on the chat request"""
+    # Only the console messages sent to the AI are considered. Each rule
+    # adds distinct suggestions, so a list keeps them ordered without
+    # deduplication
+    suggestions: List[str] = []
+    if (
+        "error" in request.message.lower() or
+        any(
+            "error" in msg.lower()
+            for msg in request.console_messages[-5:]
+        ) or
+        (request.execution_logs and "error" in
+         request.execution_logs.lower())
+    ):
+        suggestions.extend([
+            "Check your method decorators (@public/@view)",
+            "Verify type hints and parameter types",
+            "Ensure proper initialization of state variables"
+        ])
+
+    file_content = request.current_file_content
+    if file_content:
+        if "@public" not in file_content:
+            suggestions.append(
+                "Consider adding @public methods for state changes")
+        if "@view" not in file_content:
+            suggestions.append(
+                "Add @view methods for read-only operations")
+        if "@export" not in file_content:
+            suggestions.append(
+                "Don't forget to add @export decorator to your class")
+
+    return suggestions
+
+
+def build_chat_response(
+    request: ChatRequest,
+    assistant_message: str
+) -> ChatResponse:
+    """Build the chat response for a complete assistant message"""
+    # Debug log the assistant response, dropped unless LOG_LEVEL=debug.
+    # Whether code came from a <modified_code> tag is logged by the
+    # extraction itself
+    logger.debug("AI response preview", preview=assistant_message[:200])
+
+    # Extract modified code if present
+    (
+        diff_text, original_code, modified_code
+    ) = extract_modified_code_from_response(
+        assistant_message,
+        request.current_file_content
+    )
+
+    # Log extraction results
+    logger.info(
+        "Extraction results",
+        has_original=original_code is not None,
+        has_modified=modified_code is not None
+    )
+
+    # Suggestions about the current file are stale once the AI has
+    # rewritten it, so only generate them when no code was modified
+    suggestions = (
+        build_suggestions(request) if modified_code is None else []
+    )
+
+    return ChatResponse(
+        success=True,
+        message=assistant_message,
+        suggestions=suggestions,
+        original_code=original_code,
+        modified_code=modified_code
+    )
+
+
+async def generate_chat_response(
+    agent: Agent,
+    request: ChatRequest,
+    conversation_context: str,
+    cache_key: str,
+    rate_limit_key: str,
+    pre_charged_tokens: int
+) -> ChatResponse:
+    """Run the AI agent and cache the resulting chat response"""
+    result = await agent.run(conversation_context)
+    await record_token_usage(result, rate_limit_key, pre_charged_tokens)
+
+    response = build_chat_response(request, result.output)
+    await response_cache.set(cache_key, response)
+    return response
+
+
+def record_chat_turn(
+    request: ChatRequest,
+    response: ChatResponse,
+    client_ip: str
+) -> ChatResponse:
+    """
+    Remember a successful exchange in the client's chat session, returning
+    the response with the session id the client should send next
+    """
+    session_id = session_store.add_turn(
+        request.session_id, client_ip, request.message, response.message)
+    # Responses are shared through the cache, so the id goes on a copy
+    return response.model_copy(update={"session_id": session_id})
 
-        max_allowed = self.get_max_withdrawal(caller)
-        if action.amount > max_allowed:
-            raise NCFail(f"Max withdrawal: {max_allowed}")
 
-        # Track withdrawal
-        if caller not in self.withdrawals:
-            self.withdrawals[caller] = action.amount
-        else:
-            self.withdrawals[caller] += action.amount
-
-    @view
-    def get_max_withdrawal(self, address: Address) -> int:
-        total_won = self.get_winner_amount(address)
-        already_withdrawn = self.withdrawals.get(address, 0)
-        return total_won - already_withdrawn
-
-    @view
-    def get_winner_amount(self, address: Address) -> int:
-        if self.final_result is None:
-            return 0
-
-        if self.final_result not in self.bets_total:
-            return 0
-
-        result_total = self.bets_total[self.final_result]
-        if result_total == 0:
-            return 0
-
-        address_bet = self.bets_address.get((self.final_result, address), 0)
-        return address_bet * self.total // result_total
-
-```
-
----
-
-## ❌ ANTI-PATTERNS - NEVER DO THIS!
-
-### Anti-Pattern 1: Not Initializing All Attributes
-```python
-❌ WRONG:
-class TokenContract(Blueprint):
-    balances: dict[Address, int]
-    total_supply: int
-    owner: Address
-
-@public
-def initialize(self, ctx: Context, owner: Address):
-    self.owner = owner
-    # Missing initialization of balances and total_supply!
-
-✅ CORRECT:
-class TokenContract(Blueprint):
-    balances: dict[Address, int]
-    total_supply: int
-    owner: Address
-
-@public
-def initialize(self, ctx: Context, owner: Address):
-    self.owner = owner
-    self.balances = {}  # Initialize all attributes
-    self.total_supply = 0
-```
-
-### Anti-Pattern 2: Using __init__
-```python
-❌ WRONG:
-def __init__(self, initial_value: int):
-    self.value = initial_value
-
-✅ CORRECT:
-@public
-def initialize(self, ctx: Context, initial_value: int) -> None:
-    self.value = initial_value
-```
-
-### Anti-Pattern 3: Missing Decorators
-```python
-❌ WRONG:
-def transfer(self, ctx: Context, to: Address, amount: int):
-    # No decorator!
-
-✅ CORRECT:
-@public
-def transfer(self, ctx: Context, to: Address, amount: int) -> None:
-    # Has @public decorator
-```
-
-### Anti-Pattern 4: View Method Modifying State
-```python
-❌ WRONG:
-@view
-def increment(self) -> int:
-    self.count += 1  # NCViewMethodError!
-    return self.count
-
-✅ CORRECT:
-@view
-def get_count(self) -> int:
-    return self.count  # Read-only
-
-@public
-def increment(self, ctx: Context) -> None:
-    self.count += 1  # State change in @public
-```
-
-### Anti-Pattern 5: Default Values in Public/View Methods
-```python
-❌ WRONG:
-@public
-def transfer(self, ctx: Context, to: Address, amount: int = 100):
-    # Default values not allowed!
-
-@view
-def get_info(self, detailed: bool = False) -> str:
-    # Default values not allowed!
-
-✅ CORRECT:
-@public
-def transfer(self, ctx: Context, to: Address, amount: int) -> None:
-    # Caller must provide all arguments
-
-@view
-def get_info(self, detailed: bool) -> str:
-    # All parameters required
-
-# Internal methods can have defaults:
-def _calculate(self, base: int, multiplier: int = 2) -> int:
-    return base * multiplier
-```
-
-### Anti-Pattern 6: Missing Blueprint Export
-```python
-❌ WRONG:
-class MyBlueprint(Blueprint):
-    # ... methods ...
-# Missing @export decorator!
-
-✅ CORRECT:
-from hathor import export
-
-@export
-class MyBlueprint(Blueprint):
-    # ... methods ...
-```
-
-### Anti-Pattern 7: Forbidden Imports
-```python
-❌ WRONG:
-import hashlib                          # NO - forbidden import
-import datetime                         # NO - forbidden import  
-from datetime import datetime           # NO - forbidden import
-from typing import Dict, List           # NO - only specific typing imports allowed
-from json import loads                  # NO - forbidden import
-
-def some_method(self):
-    hash_val = hashlib.sha256(b"data")  # Will fail!
-
-✅ CORRECT:
-from hathor import sha3                 # Use Hathor's sha3 function
-from typing import Optional, Union      # Only these typing imports allowed
-
-def some_method(self):
-    hash_val = sha3(b"data")           # Use Hathor's built-in hashing
-```
-
-### Anti-Pattern 8: Wrong Import Syntax
-```python
-❌ WRONG:
-import hathor                          # NO - use 'from x import y' syntax only
-from hathor import *                   # NO - wildcard imports forbidden
-
-✅ CORRECT:
-from hathor import Blueprint, public, view, Context, export  # Explicit imports only
-```
-
-### Anti-Pattern 9: Misusing Container Types
-```python
-❌ WRONG: Assuming standard Python container behavior
-class BadContract(Blueprint):
-    balances: dict[Address, int]
-    
-    @public
-    def bad_method(self, ctx: Context) -> None:
-        # These operations may NOT work as expected!
-        keys = self.balances.keys()        # May not be implemented
-        values = list(self.balances.values())  # May not work
-        items = dict(self.balances.items())    # May not work
-        
-        # Wrong list operations
-        self.my_list.sort()               # Not implemented
-        self.my_list.insert(0, "item")    # Not implemented
-        
-        # Wrong set operations  
-        new_set = self.my_set.copy()      # Not implemented
-        union_set = self.my_set.union(other)  # Not implemented
-
-✅ CORRECT: Use supported container operations
-class GoodContract(Blueprint):
-    balances: dict[Address, int]
-    history: list[str]
-    members: set[Address]
-    
-    @public  
-    def good_method(self, ctx: Context) -> None:
-        # ✅ Use supported DictContainer operations
-        self.balances[address] = 100
-        balance = self.balances.get(address, 0)
-        if address in self.balances:
-            del self.balances[address]
-        
-        # ✅ Use supported DequeContainer operations  
-        self.history.append("new_event")
-        self.history.appendleft("urgent_event")
-        recent = self.history.pop()
-        
-        # ✅ Use supported SetContainer operations
-        self.members.add(address)
-        self.members.discard(address)
-        if address in self.members:
-            pass
-```
-
-### Anti-Pattern 10: Container Initialization Errors
-```python
-❌ WRONG: Not initializing containers
-class BadContract(Blueprint):
-    balances: dict[Address, int]
-    
-    @public
-    def initialize(self, ctx: Context) -> None:
-        # Missing container initialization!
-        pass
-    
-    @public
-    def use_balances(self, ctx: Context) -> None:
-        self.balances[ctx.get_caller_address()] = 100  # WILL FAIL!
-
-✅ CORRECT: Always initialize containers
-class GoodContract(Blueprint):
-    balances: dict[Address, int]
-    history: list[str]  
-    members: set[Address]
-    
-    @public
-    def initialize(self, ctx: Context) -> None:
-        # ✅ Initialize all declared containers
-        self.balances = {}      # Empty DictContainer
-        self.history = []       # Empty DequeContainer
-        self.members = set()    # Empty SetContainer
-```
-"""
+def format_sse_event(event: Dict[str, Any]) -> str:
+    """Format an event as a server-sent events data line"""
+    return f"data: {json.dumps(event)}\n\n"
 
 
-@router.post("/chat", response_model=ChatResponse)
-async def chat_with_assistant(request: ChatRequest, http_request: Request):
-    """Chat with the AI assistant"""
+async def answer_chat(
+    request: ChatRequest,
+    client_ip: str,
+    rate_limit_key: str,
+    pre_charged_tokens: int
+) -> ChatResponse:
+    """Answer a single chat request, turning failures into a response"""
     try:
         logger.info(
             "AI assistant chat request", message_length=len(request.message)
@@ -2044,255 +877,264 @@ async def chat_with_assistant(request: ChatRequest, http_request: Request):
 
         # Check if AI provider is configured
         try:
-            model = get_ai_model()
+            agent = get_ai_agent()
         except ValueError as e:
             # Return a mock response if no API key is configured
-            return ChatResponse(
-                success=True,
-                message=(
-                    "Hi! I'm Clippy, your Hathor Nano Contracts "
-                    "assistant! 📎\n\n"
-                    "I'd love to help you with your nano contracts, but I "
-                    "need an AI provider API key to be fully functional. "
-                    "For now, here are some quick tips:\n\n"
-                    "• Always use @public for state-changing methods\n"
-                    "• Use @view for read-only methods\n"
-                    "• Include type hints for all variables\n"
-                    "• Use @export decorator on your class\n\n"
-                    f"Error: {str(e)}"
-                ),
-                suggestions=[
-                    "Add proper type hints to your contract",
-                    "Use @public decorator for state-changing methods",
-                    "Check the initialize method implementation",
-                    "Validate user inputs in your methods"
-                ]
-            )
-
-        # Prepare the context for the AI
-        context_parts = [HATHOR_SYSTEM_PROMPT]
-
-        # Add current file context if available using XML structure
-        if request.current_file_content and request.current_file_name:
-            context_parts.append(
-                f"\n<current_file name=\"{request.current_file_name}\">\n"
-                f"{request.current_file_content}\n"
-                f"</current_file>"
-            )
-
-        # Add console messages if available using XML structure
-        if request.console_messages:
-            recent_messages = request.console_messages[-5:]  # Last 5 messages
-            messages_xml = "\n".join(
-                f"<message>{msg}</message>" for msg in recent_messages)
-            context_parts.append(
-                f"\n<console_messages>\n{messages_xml}\n</console_messages>"
-            )
-
-        # Add execution logs from Pyodide if available using XML structure
-        if request.execution_logs:
-            context_parts.append(
-                f"\n<execution_logs>\n{request.execution_logs}\n"
-                f"</execution_logs>"
-            )
-
-        # Add any additional context
-        if request.context:
-            context_parts.append(f"\nADDITIONAL CONTEXT: {request.context}")
-
-        full_context = "\n".join(context_parts)
+            return build_mock_response(str(e))
+
+        conversation_context = build_conversation_context(request, client_ip)
+
+        # Identical prompts get the same answer, skip the AI round trip
+        cache_key = response_cache.make_key(conversation_context, request)
+        cached_response = await response_cache.get(cache_key)
+        if cached_response is not None:
+            logger.info("AI response served from cache")
+            # No provider call was made, refund the pre-charged tokens
+            settle_token_usage(rate_limit_key, pre_charged_tokens, 0)
+            return record_chat_turn(request, cached_response, client_ip)
+
+        # Run the AI agent, or wait for an identical request in flight
+        task = inflight_requests.get(cache_key)
+        if task is None:
+            task = asyncio.create_task(generate_chat_response(
+                agent, request, conversation_context, cache_key,
+                rate_limit_key, pre_charged_tokens))
+            inflight_requests[cache_key] = task
+            task.add_done_callback(
+                lambda _: inflight_requests.pop(cache_key, None))
+        else:
+            logger.info("Joining identical in-flight AI request")
+            # The usage is charged to the request that made the call
+            settle_token_usage(rate_limit_key, pre_charged_tokens, 0)
+        response = await asyncio.shield(task)
 
-        # Build conversation history for Pydantic AI
-        conversation_messages = []
+        return record_chat_turn(request, response, client_ip)
 
-        # Add recent conversation history (limit to last 6 messages)
-        recent_history = (
-            request.conversation_history[-6:]
-            if request.conversation_history else []
+    except Exception as e:
+        logger.error(
+            "AI assistant chat failed",
+            error=str(e),
+            client_ip=client_ip,
+            exc_info=True
         )
-        for msg in recent_history:
-            conversation_messages.append(f"{msg.role}: {msg.content}")
+        return build_error_response(e)
 
-        # Add current message
-        conversation_messages.append(f"user: {request.message}")
 
-        # Create conversation context
-        conversation_context = "\n\n".join(
-            conversation_messages) if conversation_messages \
-            else request.message
+async def answer_batch_item(
+    request: ChatRequest,
+    client_ip: str,
+    rate_limit_key: str,
+    pre_charged_tokens: int
+) -> ChatResponse:
+    """Answer one request of a batch within the batch concurrency limit"""
+    async with batch_semaphore:
+        return await answer_chat(
+            request, client_ip, rate_limit_key, pre_charged_tokens)
 
-        # Use Pydantic AI agent with dynamic system prompt
-        agent = Agent(
-            model=model,
-            system_prompt=full_context
-        )
-
-        # Run the AI agent
-        result = await agent.run(conversation_context)
-        assistant_message = result.output
-
-        # Log token usage for rate limiting and cost tracking
-        usage_info = getattr(result, 'usage', None)
-        if usage_info:
-            total_tokens = getattr(usage_info, 'total_tokens', 0)
-            input_tokens = getattr(usage_info, 'prompt_tokens', 0)
-            output_tokens = getattr(usage_info, 'completion_tokens', 0)
-
-            # Log actual token usage to rate limiter
-            client_ip = http_request.client.host
-            if http_request.headers.get("x-forwarded-for"):
-                client_ip = http_request.headers.get(
-                    "x-forwarded-for").split(",")[0].strip()
-
-            # Log actual token usage if different from estimation
-            estimated_tokens = len(
-                conversation_context) // 4 + 100  # Rough estimation
-            if total_tokens != estimated_tokens:
-                # Adjust token tracking if significantly different
-                adjustment = total_tokens - estimated_tokens
-                if abs(adjustment) > 50:  # Only adjust for significant diff
-                    await token_tracker.consume_tokens(client_ip, adjustment)
 
-            logger.info(
-                "AI request completed",
-                provider=os.getenv("AI_PROVIDER", "openai"),
-                input_tokens=input_tokens,
-                output_tokens=output_tokens,
-                total_tokens=total_tokens,
-                estimated_tokens=estimated_tokens,
-                client_ip=client_ip
+@router.post("/chat", response_model=ChatResponse)
+async def chat_with_assistant(request: ChatRequest, http_request: Request):
+    """Chat with the AI assistant"""
+    return await answer_chat(
+        request,
+        get_client_ip(http_request),
+        get_rate_limit_key(http_request),
+        sum(get_pre_charged_tokens(http_request))
+    )
+
+
+@router.post("/chat/batch", response_model=BatchChatResponse)
+async def chat_with_assistant_batch(
+    batch: BatchChatRequest,
+    http_request: Request
+):
+    """Answer several independent chat requests concurrently"""
+    client_ip = get_client_ip(http_request)
+    rate_limit_key = get_rate_limit_key(http_request)
+    # The middleware pre-charged each item separately
+    pre_charged_tokens = get_pre_charged_tokens(http_request)
+    if len(pre_charged_tokens) != len(batch.items):
+        pre_charged_tokens = [sum(pre_charged_tokens)] + [0] * (
+            len(batch.items) - 1)
+    logger.info("AI assistant batch request", items=len(batch.items))
+    responses = await asyncio.gather(*(
+        answer_batch_item(item, client_ip, rate_limit_key, tokens)
+        for item, tokens in zip(batch.items, pre_charged_tokens)
+    ))
+    return BatchChatResponse(items=responses)
+
+
+# Response fields already delivered to stream clients as delta events
+STREAMED_FIELDS = {"message"}
+
+
+@router.post("/chat/stream")
+async def chat_with_assistant_stream(
+    request: ChatRequest,
+    http_request: Request
+):
+    """
+    Chat with the AI assistant, streaming the reply as server-sent events.
+    Emits `delta` events with text chunks, `modified_code` events with the
+    raw <modified_code> body as it arrives, and a single `done` event
+    carrying the ChatResponse. When the reply was sent as deltas, the
+    `done` event leaves out `message` so the reply isn't sent twice.
+    """
+    client_ip = get_client_ip(http_request)
+    rate_limit_key = get_rate_limit_key(http_request)
+    pre_charged_tokens = sum(get_pre_charged_tokens(http_request))
+    logger.info(
+        "AI assistant chat stream request",
+        message_length=len(request.message)
+    )
+
+    async def event_stream():
+        try:
+            # Check if AI provider is configured
+            try:
+                agent = get_ai_agent()
+            except ValueError as e:
+                response = build_mock_response(str(e))
+                yield format_sse_event(
+                    {"type": "done", **response.model_dump()})
+                return
+
+            conversation_context = build_conversation_context(
+                request, client_ip)
+
+            # Replay cached answers as a single delta
+            cache_key = response_cache.make_key(conversation_context, request)
+            response = await response_cache.get(cache_key)
+            if response is not None:
+                logger.info("AI response served from cache")
+                # No provider call was made, refund the pre-charged tokens
+                settle_token_usage(rate_limit_key, pre_charged_tokens, 0)
+                response = record_chat_turn(request, response, client_ip)
+                yield format_sse_event(
+                    {"type": "delta", "text": response.message})
+                yield format_sse_event({
+                    "type": "done",
+                    **response.model_dump(exclude=STREAMED_FIELDS)
+                })
+                return
+
+            chunks = []
+            code_parser = ModifiedCodeStreamParser()
+            async with agent.run_stream(conversation_context) as result:
+                async for text in result.stream_text(delta=True):
+                    chunks.append(text)
+                    yield format_sse_event({"type": "delta", "text": text})
+                    code = code_parser.feed(text)
+                    if code:
+                        yield format_sse_event(
+                            {"type": "modified_code", "text": code})
+            await record_token_usage(
+                result, rate_limit_key, pre_charged_tokens)
+
+            response = build_chat_response(request, "".join(chunks))
+            await response_cache.set(cache_key, response)
+            response = record_chat_turn(request, response, client_ip)
+            yield format_sse_event({
+                "type": "done",
+                **response.model_dump(exclude=STREAMED_FIELDS)
+            })
+
+        except Exception as e:
+            logger.error(
+                "AI assistant chat stream failed",
+                error=str(e),
+                client_ip=client_ip,
+                exc_info=True
             )
+            response = build_error_response(e)
+            yield format_sse_event({"type": "done", **response.model_dump()})
 
-        # Debug log the assistant response
-        logger.info(f"AI response preview: {assistant_message[:200]}...")
-        logger.info(
-            f"Response contains <modified_code>: "
-            f"{('<modified_code>' in assistant_message)}"
-        )
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
 
-        # Extract modified code if present
-        (
-            diff_text, original_code, modified_code
-        ) = extract_modified_code_from_response(
-            assistant_message,
-            request.current_file_content
-        )
 
-        # Log extraction results
-        logger.info(
-            f"Extraction results - has original: "
-            f"{original_code is not None}, "
-            f"has modified: {modified_code is not None}"
-        )
+class StaticJSON:
+    """
+    Constant JSON payload rendered once, served with an ETag so clients
+    can revalidate it with If-None-Match instead of downloading it again
+    """
 
-        # Generate helpful suggestions based on the response
-        suggestions = []
-        if (
-            "error" in request.message.lower() or
-            any(
-                "error" in msg.lower()
-                for msg in request.console_messages
-            ) or
-            (request.execution_logs and "error" in
-             request.execution_logs.lower())
-        ):
-            suggestions.extend([
-                "Check your method decorators (@public/@view)",
-                "Verify type hints and parameter types",
-                "Ensure proper initialization of state variables"
-            ])
-
-        if request.current_file_content:
-            if "@public" not in request.current_file_content:
-                suggestions.append(
-                    "Consider adding @public methods for state changes")
-            if "@view" not in request.current_file_content:
-                suggestions.append(
-                    "Add @view methods for read-only operations")
-            if "@export" not in request.current_file_content:
-                suggestions.append(
-                    "Don't forget to add @export decorator to your class")
-
-        return ChatResponse(
-            success=True,
-            message=assistant_message,
-            suggestions=list(set(suggestions)),  # Remove duplicates
-            original_code=original_code,
-            modified_code=modified_code
+    def __init__(self, content: Any):
+        self.body = pydantic_core.to_json(content)
+        self.etag = f'"{hashlib.sha256(self.body).hexdigest()[:16]}"'
+        self.headers = {
+            "ETag": self.etag,
+            "Cache-Control": "public, max-age=3600"
+        }
+
+    def respond(self, http_request: Request) -> Response:
+        """Return the payload, or 304 if the client already has it"""
+        if http_request.headers.get("if-none-match") == self.etag:
+            return Response(status_code=304, headers=self.headers)
+        return Response(
+            content=self.body,
+            media_type="application/json",
+            headers=self.headers
         )
 
-    except Exception as e:
-        logger.error(
-            "AI assistant chat failed", error=str(e), exc_info=True
-        )
-        return ChatResponse(
-            success=False,
-            error=f"Assistant unavailable: {str(e)}",
-            message=(
-                "Sorry, I'm having trouble right now! 😅 But here "
-                "are some general tips:\n\n"
-                "• Make sure your contract inherits from Blueprint\n"
-                "• Use proper decorators (@public/@view)\n"
-                "• Include the initialize method\n"
-                "• Use @export decorator on your class"
+
+SUGGESTIONS = StaticJSON({
+    "suggestions": [
+        "Always validate user inputs in your methods",
+        "Use proper access control patterns",
+        "Include comprehensive error handling",
+        "Write clear docstrings for all methods",
+        "Test your contracts thoroughly before deployment",
+        "Follow Hathor naming conventions",
+        "Use type hints for better code clarity",
+        "Consider gas costs in complex operations"
+    ]
+})
+
+EXAMPLES = StaticJSON({
+    "examples": [
+        {
+            "name": "Token Contract",
+            "description": (
+                "A basic token with transfer and balance functionality"
             ),
-            suggestions=[
-                "Check Hathor nano contracts documentation",
-                "Review the example contracts",
-                "Ensure proper Python syntax"
-            ]
-        )
+            "category": "Financial"
+        },
+        {
+            "name": "Voting Contract",
+            "description": (
+                "Democratic voting with proposal and ballot tracking"
+            ),
+            "category": "Governance"
+        },
+        {
+            "name": "Escrow Contract",
+            "description": (
+                "Secure multi-party transactions with dispute resolution"
+            ),
+            "category": "Financial"
+        },
+        {
+            "name": "Registry Contract",
+            "description": (
+                "Store and manage key-value data with access control"
+            ),
+            "category": "Utility"
+        }
+    ]
+})
 
 
 @router.get("/suggestions")
-async def get_suggestions():
+async def get_suggestions(http_request: Request):
     """Get general suggestions for nano contract development"""
-    return {
-        "suggestions": [
-            "Always validate user inputs in your methods",
-            "Use proper access control patterns",
-            "Include comprehensive error handling",
-            "Write clear docstrings for all methods",
-            "Test your contracts thoroughly before deployment",
-            "Follow Hathor naming conventions",
-            "Use type hints for better code clarity",
-            "Consider gas costs in complex operations"
-        ]
-    }
+    return SUGGESTIONS.respond(http_request)
 
 
 @router.get("/examples")
-async def get_examples():
+async def get_examples(http_request: Request):
     """Get example nano contract patterns"""
-    return {
-        "examples": [
-            {
-                "name": "Token Contract",
-                "description": (
-                    "A basic token with transfer and balance functionality"
-                ),
-                "category": "Financial"
-            },
-            {
-                "name": "Voting Contract",
-                "description": (
-                    "Democratic voting with proposal and ballot tracking"
-                ),
-                "category": "Governance"
-            },
-            {
-                "name": "Escrow Contract",
-                "description": (
-                    "Secure multi-party transactions with dispute resolution"
-                ),
-                "category": "Financial"
-            },
-            {
-                "name": "Registry Contract",
-                "description": (
-                    "Store and manage key-value data with access control"
-                ),
-                "category": "Utility"
-            }
-        ]
-    }
+    return EXAMPLES.respond(http_request)
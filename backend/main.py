@@ -2,20 +2,32 @@
 Main FastAPI application for Nano Contracts IDE
 """
 from contextlib import asynccontextmanager
+import logging
+import os
 from dotenv import load_dotenv
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse
 import structlog
 
-from api.ai_assistant import router as ai_assistant_router
-from middleware.rate_limit import limiter, token_limit_middleware, \
-    rate_limit_exceeded_handler
-from slowapi.errors import RateLimitExceeded
-
-# Load environment variables from .env file
+# Load environment variables from .env file before importing modules that
+# read their configuration at import time
 load_dotenv()
 
+from api.ai_assistant import router as ai_assistant_router, \
+    close_http_client  # noqa: E402
+from middleware.rate_limit import limiter, token_limit_middleware, \
+    rate_limit_exceeded_handler  # noqa: E402
+from slowapi.errors import RateLimitExceeded  # noqa: E402
+
+# Drop log calls below LOG_LEVEL before any event processing and cache
+# the bound loggers after their first use
+structlog.configure(
+    wrapper_class=structlog.make_filtering_bound_logger(
+        getattr(logging, os.getenv("LOG_LEVEL", "info").upper(), logging.INFO)
+    ),
+    cache_logger_on_first_use=True,
+)
 
 logger = structlog.get_logger()
 
@@ -32,6 +44,7 @@ async def lifespan(app: FastAPI):
 
     # Shutdown
     logger.info("Shutting down Nano Contracts IDE Backend")
+    await close_http_client()
 
 
 # Create FastAPI application
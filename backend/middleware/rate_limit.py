@@ -3,7 +3,7 @@ Rate limiting middleware with Redis backend using slowapi
 """
 import time
 import json
-from typing import Tuple
+from typing import Any, List, Optional, Tuple
 from fastapi import Request
 from fastapi.responses import JSONResponse
 import redis.asyncio as redis
@@ -54,6 +54,14 @@ def get_redis_connection():
         return None
 
 
+def get_rate_limit_key(request: Request) -> str:
+    """
+    Key a request is rate limited and charged tokens under. Token usage
+    settled after the request is answered must use the same key.
+    """
+    return get_remote_address(request)
+
+
 # Initialize slowapi limiter with configurable limits
 default_ip_limit = os.getenv("RATE_LIMIT_IP_REQUESTS", "50")
 
@@ -67,7 +75,7 @@ else:
     storage_uri = "memory://"
 
 limiter = Limiter(
-    key_func=get_remote_address,
+    key_func=get_rate_limit_key,
     storage_uri=storage_uri,
     # Configurable requests per hour per IP
     default_limits=[f"{default_ip_limit}/hour"]
@@ -83,8 +91,8 @@ class SimpleRateLimiter:
         # Configurable window
         self.window = int(os.getenv("RATE_LIMIT_WINDOW", "3600"))
 
-    def check_rate_limit(self, ip: str) -> bool:
-        """Check if IP is within rate limit"""
+    def check_rate_limit(self, ip: str, cost: int = 1) -> bool:
+        """Check if IP is within rate limit, counting cost requests"""
         now = time.time()
 
         # Clean old entries
@@ -98,11 +106,11 @@ class SimpleRateLimiter:
         ]
 
         # Check if limit exceeded
-        if len(self.requests[ip]) >= self.limit:
+        if len(self.requests[ip]) + cost > self.limit:
             return False
 
-        # Add current request
-        self.requests[ip].append(now)
+        # Add current requests
+        self.requests[ip].extend([now] * cost)
         return True
 
 
@@ -116,10 +124,16 @@ class TokenTracker:
 
     def __init__(self):
         self.redis = get_redis_connection()
+        # Every chat also sends the ~14k token system prompt, so limits
+        # must leave room for several full requests per window
         self.ip_token_limit = int(
-            os.getenv("RATE_LIMIT_IP_TOKENS", "10000"))  # per hour
+            os.getenv("RATE_LIMIT_IP_TOKENS", "200000"))  # per hour
         self.global_token_limit = int(
-            os.getenv("RATE_LIMIT_GLOBAL_TOKENS", "100000"))  # per hour
+            os.getenv("RATE_LIMIT_GLOBAL_TOKENS", "2000000"))  # per hour
+        # Fraction of each input token served from the provider's prompt
+        # cache that is charged, cached tokens are billed at a discount
+        self.cached_token_weight = float(
+            os.getenv("RATE_LIMIT_CACHED_TOKEN_WEIGHT", "0.1"))
         # Configurable window
         self.window = int(os.getenv("RATE_LIMIT_WINDOW", "3600"))
 
@@ -132,19 +146,20 @@ class TokenTracker:
         # Use configurable window for time bucketing
         current_bucket = int(time.time() // self.window)
 
-        # Check IP token limit
+        # Read both counters in a single round trip
         ip_key = f"tokens:ip:{ip}:{current_bucket}"
-        ip_tokens = await self.redis.get(ip_key) or 0
-        ip_tokens = int(ip_tokens)
+        global_key = f"tokens:global:{current_bucket}"
+        ip_tokens, global_tokens = await self.redis.mget(ip_key, global_key)
+
+        # Check IP token limit
+        ip_tokens = int(ip_tokens or 0)
 
         if ip_tokens + estimated_tokens > self.ip_token_limit:
             return False, f"IP token limit exceeded. Used: \
                     {ip_tokens}/{self.ip_token_limit}"
 
         # Check global token limit
-        global_key = f"tokens:global:{current_bucket}"
-        global_tokens = await self.redis.get(global_key) or 0
-        global_tokens = int(global_tokens)
+        global_tokens = int(global_tokens or 0)
 
         if global_tokens + estimated_tokens > self.global_token_limit:
             return False, f"Global token limit exceeded. Used: \
@@ -159,16 +174,18 @@ class TokenTracker:
 
         current_bucket = int(time.time() // self.window)
 
-        # Update IP tokens
         ip_key = f"tokens:ip:{ip}:{current_bucket}"
-        await self.redis.incrby(ip_key, tokens)
-        # Expire after configured window
-        await self.redis.expire(ip_key, self.window)
-
-        # Update global tokens
         global_key = f"tokens:global:{current_bucket}"
-        await self.redis.incrby(global_key, tokens)
-        await self.redis.expire(global_key, self.window)
+        # INCRBY is atomic on the server, so the updates are sent in one
+        # pipelined round trip without a transaction
+        async with self.redis.pipeline(transaction=False) as pipe:
+            # Update IP tokens, expiring after configured window
+            pipe.incrby(ip_key, tokens)
+            pipe.expire(ip_key, self.window)
+            # Update global tokens
+            pipe.incrby(global_key, tokens)
+            pipe.expire(global_key, self.window)
+            await pipe.execute()
 
         logger.info(
             "Token usage recorded",
@@ -189,6 +206,51 @@ def estimate_tokens(text: str) -> int:
     return max(len(text) // 4, 10)  # Minimum 10 tokens
 
 
+def estimate_request_tokens(
+    message: str,
+    current_file_content: Optional[str] = None
+) -> int:
+    """Tokens pre-charged for a single chat request before it is answered"""
+    tokens = estimate_tokens(message)
+    if current_file_content:
+        tokens += estimate_tokens(current_file_content)
+    # Add buffer for system prompt and response
+    return int(tokens * 1.5)
+
+
+# Tokens pre-charged for a request body that can't be estimated
+FALLBACK_TOKENS = 100
+
+# Only this route answers several chat requests, listed in "items"
+BATCH_CHAT_PATH = "/api/ai/chat/batch"
+
+
+def estimate_chat_item_tokens(item: Any) -> int:
+    """Tokens pre-charged for one chat request of a request body"""
+    if not isinstance(item, dict) or not isinstance(item.get("message"), str):
+        return FALLBACK_TOKENS
+    file_content = item.get("current_file_content")
+    if not isinstance(file_content, str):
+        file_content = None
+    return estimate_request_tokens(item["message"], file_content)
+
+
+def estimate_body_tokens(path: str, body: bytes) -> List[int]:
+    """
+    Tokens pre-charged for each chat request of a POST body, in order.
+    Every body is charged at least one request's worth of tokens.
+    """
+    try:
+        data = json.loads(body)
+    except ValueError:
+        return [FALLBACK_TOKENS]
+
+    items = data.get("items") if isinstance(data, dict) else None
+    if path == BATCH_CHAT_PATH and isinstance(items, list) and items:
+        return [estimate_chat_item_tokens(item) for item in items]
+    return [estimate_chat_item_tokens(data)]
+
+
 async def token_limit_middleware(request: Request, call_next):
     """Token-based cost control middleware"""
 
@@ -197,10 +259,29 @@ async def token_limit_middleware(request: Request, call_next):
         return await call_next(request)
 
     # Get client IP
-    client_ip = get_remote_address(request)
+    client_ip = get_rate_limit_key(request)
 
-    # Check basic rate limit first (requests per hour)
-    if not simple_rate_limiter.check_rate_limit(client_ip):
+    # Estimate tokens for POST requests, counting each item of a batch
+    # chat request as one request against the request limit
+    item_tokens: List[int] = []
+    if request.method == "POST":
+        try:
+            body = await request.body()
+            item_tokens = estimate_body_tokens(request.url.path, body)
+
+            # Recreate request with body
+            async def receive():
+                return {"type": "http.request", "body": body}
+            request._receive = receive
+
+        except Exception as e:
+            logger.warning("Failed to estimate tokens", error=str(e))
+            item_tokens = [FALLBACK_TOKENS]
+    estimated_tokens = sum(item_tokens)
+    request_count = max(len(item_tokens), 1)
+
+    # Check basic rate limit (requests per hour)
+    if not simple_rate_limiter.check_rate_limit(client_ip, request_count):
         logger.warning(
             "Request rate limit exceeded",
             ip=client_ip,
@@ -218,34 +299,6 @@ async def token_limit_middleware(request: Request, call_next):
             headers={"Retry-After": str(simple_rate_limiter.window)}
         )
 
-    # Estimate tokens for POST requests
-    estimated_tokens = 0
-    if request.method == "POST":
-        try:
-            body = await request.body()
-            if body:
-                try:
-                    data = json.loads(body)
-                    if "message" in data:
-                        estimated_tokens = estimate_tokens(data["message"])
-                        if "current_file_content" in data and \
-                                data["current_file_content"]:
-                            estimated_tokens += estimate_tokens(
-                                data["current_file_content"])
-                        # Add buffer for system prompt and response
-                        estimated_tokens = int(estimated_tokens * 1.5)
-                except json.JSONDecodeError:
-                    estimated_tokens = 100
-
-            # Recreate request with body
-            async def receive():
-                return {"type": "http.request", "body": body}
-            request._receive = receive
-
-        except Exception as e:
-            logger.warning("Failed to estimate tokens", error=str(e))
-            estimated_tokens = 100
-
     # Check token limits
     if estimated_tokens > 0:
         allowed, error_msg = await token_tracker.\
@@ -268,8 +321,10 @@ async def token_limit_middleware(request: Request, call_next):
                 headers={"Retry-After": str(token_tracker.window)}
             )
 
-        # Pre-consume estimated tokens
+        # Pre-consume estimated tokens, remembering the charge for each
+        # chat request so it is settled against the provider usage
         await token_tracker.consume_tokens(client_ip, estimated_tokens)
+        request.state.pre_charged_tokens = item_tokens
 
     # Process request
     response = await call_next(request)
@@ -288,7 +343,7 @@ def rate_limit_exceeded_handler(request: Request, exc: RateLimitExceeded):
     """Custom handler for rate limit exceeded"""
     logger.warning(
         "Rate limit exceeded",
-        ip=get_remote_address(request),
+        ip=get_rate_limit_key(request),
         path=request.url.path,
         limit=str(exc.detail)
     )
@@ -0,0 +1,505 @@
+"""Tests for the AI assistant response helpers."""
+
+import asyncio
+import json
+import sys
+from pathlib import Path
+from types import SimpleNamespace
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from structlog.testing import capture_logs
+from pydantic_ai import Agent
+from pydantic_ai.models.test import TestModel
+from pydantic_ai.usage import RunUsage
+
+# Ensure backend directory is on path for module resolution
+ROOT_DIR = Path(__file__).resolve().parent.parent
+sys.path.append(str(ROOT_DIR))
+
+from api import ai_assistant  # noqa: E402
+from middleware import rate_limit  # noqa: E402
+from api.ai_assistant import (  # noqa: E402
+    ChatResponse,
+    ModifiedCodeStreamParser,
+    ResponseCache,
+    extract_modified_code_from_response,
+)
+
+CODE = "from hathor import Blueprint\n\nclass Counter(Blueprint):\n    pass"
+REPLY = f"Updated.\n<modified_code>\n{CODE}\n</modified_code>"
+
+
+def use_memory_response_cache(monkeypatch):
+    """Give the test a fresh response cache that never touches Redis"""
+    cache = ai_assistant.ResponseCache()
+    cache.redis = None
+    monkeypatch.setattr(ai_assistant, "response_cache", cache)
+
+
+def make_client(monkeypatch):
+    """Build a client whose assistant always answers with REPLY"""
+    agent = Agent(TestModel(custom_output_text=REPLY))
+    monkeypatch.setattr(ai_assistant, "get_ai_agent", lambda: agent)
+    use_memory_response_cache(monkeypatch)
+    app = FastAPI()
+    app.include_router(ai_assistant.router, prefix="/api/ai")
+    return TestClient(app)
+
+
+def test_extracts_modified_code_tag():
+    response = f"Here you go:\n<modified_code>\n{CODE}\n</modified_code>\nDone"
+    assert extract_modified_code_from_response(response, "old") == (
+        None, "old", CODE)
+
+
+def test_strips_fences_inside_modified_code_tag():
+    response = f"<modified_code>\n```python\n{CODE}\n```\n</modified_code>"
+    _, _, modified = extract_modified_code_from_response(response, "old")
+    assert modified == CODE
+
+
+def test_strips_generic_fences_inside_modified_code_tag():
+    response = f"<modified_code>```py\n{CODE}\n```</modified_code>"
+    _, _, modified = extract_modified_code_from_response(response, "old")
+    assert modified == CODE
+    response = f"<modified_code>```\n{CODE}\n   ```   </modified_code>"
+    _, _, modified = extract_modified_code_from_response(response, "old")
+    assert modified == CODE
+
+
+def test_unclosed_tag_falls_back_to_legacy_block():
+    response = f"<modified_code>\n```python:modified\n{CODE}\n```"
+    assert extract_modified_code_from_response(response, "old") == (
+        None, "old", CODE)
+
+
+def test_regular_python_block_requires_contract_structure():
+    response = "```python\nx = 1\n```"
+    assert extract_modified_code_from_response(response, "old") == (
+        None, None, None)
+    response = f"```python\n{CODE}\n```"
+    assert extract_modified_code_from_response(response, "old") == (
+        None, "old", CODE)
+
+
+def test_fallbacks_require_original_code():
+    response = f"```python\n{CODE}\n```"
+    assert extract_modified_code_from_response(response) == (
+        None, None, None)
+
+
+async def test_response_cache_evicts_least_recently_used():
+    cache = ResponseCache()
+    cache.max_size = 2
+    cache.redis = None
+    responses = [ChatResponse(success=True, message=str(i)) for i in range(3)]
+    await cache.set("a", responses[0])
+    await cache.set("b", responses[1])
+    assert await cache.get("a") is responses[0]
+    await cache.set("c", responses[2])
+    assert await cache.get("b") is None
+    assert await cache.get("a") is responses[0]
+    assert await cache.get("c") is responses[2]
+
+
+def test_chat_returns_modified_code(monkeypatch):
+    client = make_client(monkeypatch)
+    response = client.post(
+        "/api/ai/chat",
+        json={"message": "fix it", "current_file_content": "old"}
+    )
+    data = response.json()
+    assert data["success"] is True
+    assert data["message"] == REPLY
+    assert data["modified_code"] == CODE
+    assert data["suggestions"] == []
+
+
+def test_chat_stream_emits_deltas_then_done(monkeypatch):
+    client = make_client(monkeypatch)
+    response = client.post(
+        "/api/ai/chat/stream",
+        json={"message": "fix it", "current_file_content": "old"}
+    )
+    assert response.headers["content-type"].startswith("text/event-stream")
+    events = [
+        json.loads(line[len("data: "):])
+        for line in response.text.splitlines() if line.startswith("data: ")
+    ]
+    assert events[-1]["type"] == "done"
+    assert events[-1]["modified_code"] == CODE
+    assert "message" not in events[-1]
+    deltas = [event["text"] for event in events if event["type"] == "delta"]
+    assert "".join(deltas) == REPLY
+    code = [e["text"] for e in events if e["type"] == "modified_code"]
+    assert "".join(code).strip() == CODE
+
+
+def test_chat_uses_server_issued_session_history(monkeypatch):
+    client = make_client(monkeypatch)
+    monkeypatch.setattr(
+        ai_assistant, "session_store", ai_assistant.ChatSessionStore())
+    # Ids chosen by the client are replaced by a server-issued one
+    response = client.post(
+        "/api/ai/chat", json={"message": "hi", "session_id": "s1"})
+    session_id = response.json()["session_id"]
+    assert session_id != "s1"
+    assert all(
+        cached.session_id is None
+        for cached in ai_assistant.response_cache.responses.values()
+    )
+    request = ai_assistant.ChatRequest(message="again", session_id=session_id)
+    context = ai_assistant.build_conversation_context(request, "testclient")
+    assert context == f"user: hi\n\nassistant: {REPLY}\n\nuser: again"
+    # Other clients sending the id only get the history they sent
+    request = ai_assistant.ChatRequest(
+        message="again",
+        session_id=session_id,
+        conversation_history=[{"role": "user", "content": "mine"}]
+    )
+    context = ai_assistant.build_conversation_context(request, "10.0.0.1")
+    assert context == "user: mine\n\nuser: again"
+
+
+async def test_identical_concurrent_chats_share_one_ai_call(monkeypatch):
+    calls = []
+
+    async def generate(*args):
+        calls.append(args)
+        await asyncio.sleep(0.01)
+        return ChatResponse(success=True, message="shared")
+
+    agent = Agent(TestModel(custom_output_text=REPLY))
+    monkeypatch.setattr(ai_assistant, "get_ai_agent", lambda: agent)
+    monkeypatch.setattr(ai_assistant, "generate_chat_response", generate)
+    use_memory_response_cache(monkeypatch)
+    http_request = SimpleNamespace(
+        client=SimpleNamespace(host="127.0.0.1"),
+        headers={},
+        state=SimpleNamespace()
+    )
+    request = ai_assistant.ChatRequest(message="same question")
+    responses = await asyncio.gather(*(
+        ai_assistant.chat_with_assistant(request, http_request)
+        for _ in range(3)
+    ))
+    assert len(calls) == 1
+    assert [response.message for response in responses] == ["shared"] * 3
+    assert ai_assistant.inflight_requests == {}
+
+
+async def test_response_cache_reads_through_redis():
+    class FakeRedis:
+        def __init__(self):
+            self.data = {}
+
+        async def get(self, key):
+            return self.data.get(key)
+
+        async def set(self, key, value, ex=None):
+            self.data[key] = value
+
+    writer, reader = ResponseCache(), ResponseCache()
+    writer.redis = reader.redis = FakeRedis()
+    reader.redis.data = writer.redis.data
+    await writer.set("k", ChatResponse(success=True, message="hi"))
+    response = await reader.get("k")
+    assert response.message == "hi"
+    assert reader.responses["k"] is response
+
+
+def test_response_cache_key_depends_on_provider_and_model(monkeypatch):
+    request = ai_assistant.ChatRequest(message="hi")
+    keys = set()
+    for provider, model in (
+        ("openai", "gpt-4o-mini"), ("openai", "gpt-4o"), ("gemini", "gpt-4o")
+    ):
+        monkeypatch.setattr(
+            ai_assistant, "ai_settings",
+            ai_assistant.AISettings(provider, None, None))
+        monkeypatch.setitem(ai_assistant.AI_MODEL_NAMES, provider, model)
+        keys.add(ResponseCache.make_key("user: hi", request))
+    assert len(keys) == 3
+
+
+async def test_response_cache_treats_stale_entries_as_misses():
+    class FakeRedis:
+        async def get(self, key):
+            return '{"unexpected": true}'
+
+    cache = ResponseCache()
+    cache.redis = FakeRedis()
+    assert await cache.get("k") is None
+    assert "k" not in cache.responses
+
+
+def test_cached_response_keeps_requester_file(monkeypatch):
+    client = make_client(monkeypatch)
+    agent = Agent(TestModel(custom_output_text=f"```python\n{CODE}\n```"))
+    monkeypatch.setattr(ai_assistant, "get_ai_agent", lambda: agent)
+    for code in ("ALICE SECRET", "bob code"):
+        response = client.post(
+            "/api/ai/chat",
+            json={"message": "fix", "current_file_content": code}
+        )
+        assert response.json()["original_code"] == code
+
+
+def test_modified_code_stream_parser_handles_split_tags():
+    parser = ModifiedCodeStreamParser()
+    text = f"<modified_code>\n{CODE}\n</modified_code> <modified_code>x"
+    code = "".join(parser.feed(char) for char in text)
+    assert code == f"\n{CODE}\n"
+
+
+def test_chat_batch_answers_items_in_order(monkeypatch):
+    client = make_client(monkeypatch)
+    response = client.post(
+        "/api/ai/chat/batch",
+        json={"items": [
+            {"message": "fix it", "current_file_content": "old"},
+            {"message": "explain"},
+        ]}
+    )
+    items = response.json()["items"]
+    assert [item["message"] for item in items] == [REPLY, REPLY]
+    assert [item["original_code"] for item in items] == ["old", None]
+
+
+def test_batch_items_count_against_request_limit(monkeypatch):
+    limiter = rate_limit.SimpleRateLimiter()
+    limiter.limit = 3
+    monkeypatch.setattr(rate_limit, "simple_rate_limiter", limiter)
+    monkeypatch.setattr(rate_limit.token_tracker, "redis", None)
+    client = make_client(monkeypatch)
+    client.app.middleware("http")(rate_limit.token_limit_middleware)
+    batch = {"items": [{"message": "a"}, {"message": "b"}]}
+    assert client.post("/api/ai/chat/batch", json=batch).status_code == 200
+    assert client.post("/api/ai/chat/batch", json=batch).status_code == 429
+    response = client.post("/api/ai/chat", json={"message": "c"})
+    assert response.status_code == 200
+
+
+def test_only_batch_bodies_are_estimated_per_item():
+    chat = json.dumps({"message": "x" * 4000, "items": []}).encode()
+    assert rate_limit.estimate_body_tokens("/api/ai/chat", chat) == [1500]
+    batch = json.dumps({"items": [1, {"message": "hi"}]}).encode()
+    assert rate_limit.estimate_body_tokens(
+        rate_limit.BATCH_CHAT_PATH, batch) == [100, 15]
+    assert rate_limit.estimate_body_tokens("/api/ai/chat", b"{") == [100]
+
+
+def test_chat_rejects_oversized_requests(monkeypatch):
+    client = make_client(monkeypatch)
+    history = [{"role": "user", "content": "hi"}] * 21
+    response = client.post(
+        "/api/ai/chat",
+        json={"message": "hi", "conversation_history": history}
+    )
+    assert response.status_code == 422
+    response = client.post(
+        "/api/ai/chat",
+        json={"message": "x" * (ai_assistant.MAX_CHAT_STRING_LENGTH + 1)}
+    )
+    assert response.status_code == 422
+
+
+def test_chat_keeps_tail_of_oversized_execution_logs(monkeypatch):
+    client = make_client(monkeypatch)
+    logs = "a" * ai_assistant.MAX_CHAT_STRING_LENGTH + "Error: boom"
+    response = client.post(
+        "/api/ai/chat", json={"message": "why?", "execution_logs": logs})
+    assert response.status_code == 200
+    request = ai_assistant.ChatRequest(message="why?", execution_logs=logs)
+    assert len(request.execution_logs) == ai_assistant.MAX_CHAT_STRING_LENGTH
+    assert request.execution_logs.endswith("Error: boom")
+
+
+def test_conversation_context_keeps_tail_of_long_execution_logs():
+    logs = "a" * 2 * ai_assistant.MAX_EXECUTION_LOG_CHARS + "Error: boom"
+    request = ai_assistant.ChatRequest(message="why?", execution_logs=logs)
+    context = ai_assistant.build_conversation_context(request, "127.0.0.1")
+    assert "Error: boom" in context
+    assert "earlier logs truncated" in context
+    assert len(context) < len(logs)
+
+
+def test_fast_json_response_matches_json_response():
+    content = {"message": "caf\u00e9", "items": [1, None, True]}
+    assert ai_assistant.FastJSONResponse(content).body == (
+        ai_assistant.JSONResponse(content).body)
+
+
+async def test_chat_without_provider_returns_shared_mock_response(
+        monkeypatch):
+    monkeypatch.setattr(
+        ai_assistant, "ai_settings",
+        ai_assistant.AISettings("openai", None, None))
+    http_request = SimpleNamespace(
+        client=SimpleNamespace(host="127.0.0.1"),
+        headers={},
+        state=SimpleNamespace()
+    )
+    request = ai_assistant.ChatRequest(message="hi")
+    first = await ai_assistant.chat_with_assistant(request, http_request)
+    second = await ai_assistant.chat_with_assistant(request, http_request)
+    assert first is second
+    assert first.message.endswith("Error: OpenAI API key not configured")
+
+
+async def test_failed_background_task_is_logged():
+    async def fail():
+        raise RuntimeError("redis down")
+
+    task = asyncio.create_task(fail())
+    ai_assistant.background_tasks.add(task)
+    with capture_logs() as logs:
+        await asyncio.wait([task])
+        ai_assistant.forget_background_task(task)
+    assert task not in ai_assistant.background_tasks
+    assert logs[0]["event"] == "Background task failed"
+    assert logs[0]["error"] == "redis down"
+
+
+def test_static_endpoints_revalidate_with_etag(monkeypatch):
+    client = make_client(monkeypatch)
+    response = client.get("/api/ai/examples")
+    assert response.status_code == 200
+    assert len(response.json()["examples"]) == 4
+    etag = response.headers["etag"]
+    response = client.get(
+        "/api/ai/examples", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.content == b""
+
+
+def test_suggestions_keep_rule_order():
+    request = ai_assistant.ChatRequest(
+        message="I get an error", current_file_content="class A: pass")
+    assert ai_assistant.build_suggestions(request) == [
+        "Check your method decorators (@public/@view)",
+        "Verify type hints and parameter types",
+        "Ensure proper initialization of state variables",
+        "Consider adding @public methods for state changes",
+        "Add @view methods for read-only operations",
+        "Don't forget to add @export decorator to your class",
+    ]
+
+
+def test_conversation_context_wraps_last_console_messages():
+    request = ai_assistant.ChatRequest(
+        message="hi", console_messages=[str(i) for i in range(7)])
+    context = ai_assistant.build_conversation_context(request, "127.0.0.1")
+    assert context == (
+        "<console_messages>\n<message>2</message>\n<message>3</message>\n"
+        "<message>4</message>\n<message>5</message>\n<message>6</message>"
+        "\n</console_messages>\n\nuser: hi"
+    )
+
+
+async def test_record_token_usage_reads_run_usage(monkeypatch):
+    consumed = []
+
+    async def consume_tokens(ip, tokens):
+        consumed.append((ip, tokens))
+
+    monkeypatch.setattr(
+        ai_assistant.token_tracker, "consume_tokens", consume_tokens)
+    usage = RunUsage(input_tokens=900, output_tokens=100)
+    # Older pydantic-ai versions expose usage as a method
+    for result in (
+        SimpleNamespace(usage=usage), SimpleNamespace(usage=lambda: usage)
+    ):
+        with capture_logs() as logs:
+            await ai_assistant.record_token_usage(result, "1.2.3.4", 150)
+            await asyncio.gather(*ai_assistant.background_tasks)
+        assert logs[-1]["input_tokens"] == 900
+        assert logs[-1]["output_tokens"] == 100
+        assert logs[-1]["total_tokens"] == 1000
+    assert consumed == [("1.2.3.4", 850)] * 2
+
+
+class FakeTokenRedis:
+    """In-memory stand-in for the Redis calls TokenTracker makes"""
+
+    def __init__(self):
+        self.data = {}
+
+    async def mget(self, *keys):
+        return [self.data.get(key) for key in keys]
+
+    def pipeline(self, transaction=True):
+        return self
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        pass
+
+    def incrby(self, key, amount):
+        self.data[key] = self.data.get(key, 0) + amount
+
+    def expire(self, key, seconds):
+        pass
+
+    async def execute(self):
+        pass
+
+
+async def test_default_token_limits_allow_follow_up_chat(monkeypatch):
+    tracker = rate_limit.TokenTracker()
+    tracker.redis = FakeTokenRedis()
+    monkeypatch.setattr(ai_assistant, "token_tracker", tracker)
+    request = ai_assistant.ChatRequest(
+        message="fix it", current_file_content=CODE)
+    estimate = rate_limit.estimate_request_tokens(
+        request.message, request.current_file_content)
+    prompt_tokens = len(ai_assistant.HATHOR_SYSTEM_PROMPT) // 4
+    # The first chat misses the provider's prompt cache, the second hits it
+    for cached_tokens in (0, prompt_tokens):
+        assert await tracker.check_token_limits("1.2.3.4", estimate) == (
+            True, "")
+        await tracker.consume_tokens("1.2.3.4", estimate)
+        usage = RunUsage(
+            input_tokens=prompt_tokens + 500,
+            output_tokens=1000,
+            cache_read_tokens=cached_tokens
+        )
+        await ai_assistant.record_token_usage(
+            SimpleNamespace(usage=usage), "1.2.3.4", estimate)
+        await asyncio.gather(*ai_assistant.background_tasks)
+    assert await tracker.check_token_limits("1.2.3.4", estimate) == (True, "")
+    charged = int(prompt_tokens * tracker.cached_token_weight)
+    assert sorted(tracker.redis.data.values()) == [
+        2 * (prompt_tokens + 1500) - prompt_tokens + charged] * 2
+
+
+async def test_token_usage_is_settled_under_the_middleware_key(monkeypatch):
+    tracker = rate_limit.TokenTracker()
+    tracker.redis = FakeTokenRedis()
+    monkeypatch.setattr(ai_assistant, "token_tracker", tracker)
+    agent = Agent(TestModel(custom_output_text=REPLY))
+    monkeypatch.setattr(ai_assistant, "get_ai_agent", lambda: agent)
+    use_memory_response_cache(monkeypatch)
+    # Behind a proxy the forwarded client differs from the peer address
+    # The amount the middleware pre-charged is settled, whatever it was
+    http_request = SimpleNamespace(
+        client=SimpleNamespace(host="10.0.0.1"),
+        headers={"x-forwarded-for": "9.9.9.9"},
+        state=SimpleNamespace(pre_charged_tokens=[777])
+    )
+    key = rate_limit.get_rate_limit_key(http_request)
+    request = ai_assistant.ChatRequest(message="x" * 4000)
+    buckets = []
+    # The second request is served from the cache, its pre-charge refunded
+    for _ in range(2):
+        await tracker.consume_tokens(key, 777)
+        await ai_assistant.chat_with_assistant(request, http_request)
+        await asyncio.gather(*ai_assistant.background_tasks)
+        buckets.append(dict(tracker.redis.data))
+    assert buckets[0] == buckets[1]
+    assert all(
+        bucket.startswith(("tokens:ip:10.0.0.1:", "tokens:global:"))
+        for bucket in buckets[0]
+    )
@@ -3,6 +3,8 @@
 import sys
 import types
 from pathlib import Path
+from unittest.mock import patch
+import pytest
 from fastapi import APIRouter
 from fastapi.testclient import TestClient
 from slowapi import Limiter
@@ -27,23 +29,42 @@ rate_limit_module.token_limit_middleware = lambda request, \
 rate_limit_module.rate_limit_exceeded_handler = lambda request, exc: None
 
 middleware_module.rate_limit = rate_limit_module
-sys.modules.setdefault("middleware", middleware_module)
-sys.modules.setdefault("middleware.rate_limit", rate_limit_module)
 
 # Mock API module
 api_module = types.ModuleType("api")
 ai_module = types.ModuleType("api.ai_assistant")
 ai_module.router = APIRouter()
+
+
+async def close_http_client():
+    pass
+
+
+ai_module.close_http_client = close_http_client
 api_module.ai_assistant = ai_module
-sys.modules.setdefault("api", api_module)
-sys.modules.setdefault("api.ai_assistant", ai_module)
 
-from main import app  # noqa: E402
+STUB_MODULES = {
+    "middleware": middleware_module,
+    "middleware.rate_limit": rate_limit_module,
+    "api": api_module,
+    "api.ai_assistant": ai_module,
+}
+
 
-client = TestClient(app)
+@pytest.fixture(scope="module")
+def client():
+    """
+    Client for the app imported against the stub modules. The stubs, and
+    the main module built on them, are removed again afterwards so other
+    test modules import the real ones.
+    """
+    with patch.dict(sys.modules, STUB_MODULES):
+        sys.modules.pop("main", None)
+        from main import app
+        yield TestClient(app)
 
 
-def test_root():
+def test_root(client):
     response = client.get("/")
     assert response.status_code == 200
     data = response.json()
@@ -51,7 +72,7 @@ def test_root():
     assert data["version"] == "1.0.0"
 
 
-def test_health_check():
+def test_health_check(client):
     response = client.get("/health")
     assert response.status_code == 200
     assert response.json() == {"status": "healthy"}
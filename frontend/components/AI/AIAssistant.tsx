@@ -28,7 +28,11 @@ interface AIAssistantProps {
 export const AIAssistant: React.FC<AIAssistantProps> = ({ isCollapsed, onToggleCollapse }) => {
   const [inputMessage, setInputMessage] = useState('');
   const [isLoading, setIsLoading] = useState(false);
+  const [streamingContent, setStreamingContent] = useState('');
+  const [streamingCodeLines, setStreamingCodeLines] = useState(0);
   const messageIdCounter = useRef(0);
+  // Backend chat session ids, issued with each response, by chat session
+  const backendSessionIds = useRef<Record<string, string>>({});
   const messagesEndRef = useRef<HTMLDivElement>(null);
   const textareaRef = useRef<HTMLTextAreaElement>(null);
   const { 
@@ -71,7 +75,7 @@ export const AIAssistant: React.FC<AIAssistantProps> = ({ isCollapsed, onToggleC
   // Auto-scroll to bottom when new messages arrive
   useEffect(() => {
     scrollToBottom();
-  }, [messages]);
+  }, [messages, streamingContent]);
 
   useEffect(() => {
     if (textareaRef.current) {
@@ -110,6 +114,8 @@ export const AIAssistant: React.FC<AIAssistantProps> = ({ isCollapsed, onToggleC
     addChatMessage(activeChatSessionId, userMessage);
     setInputMessage('');
     setIsLoading(true);
+    setStreamingContent('');
+    setStreamingCodeLines(0);
 
     try {
       // Prepare context for the AI
@@ -117,7 +123,9 @@ export const AIAssistant: React.FC<AIAssistantProps> = ({ isCollapsed, onToggleC
         .slice(-5)
         .map(msg => `[${msg.type.toUpperCase()}] ${msg.message}`);
 
-      // Convert recent messages to conversation history (last 6 messages)
+      // Convert recent messages to conversation history (last 6 messages).
+      // The backend prefers the history it keeps for the session, this one
+      // is used when it has none (e.g. after a restart)
       const conversationHistory = messages
         .slice(-6)
         .map(msg => ({
@@ -125,19 +133,23 @@ export const AIAssistant: React.FC<AIAssistantProps> = ({ isCollapsed, onToggleC
           content: msg.content
         }));
 
-      const response = await aiApi.chat({
+      const response = await aiApi.chatStream({
         message: inputMessage.trim(),
         current_file_content: activeFile?.content,
         current_file_name: activeFile?.name,
         console_messages: recentConsoleMessages,
         execution_logs: lastExecutionLogs || undefined,  // Include execution logs from Pyodide
         conversation_history: conversationHistory,
+        session_id: backendSessionIds.current[activeChatSessionId],
         context: {
           total_files: files.length,
           has_compiled_contracts: consoleMessages.some(msg => msg.message.includes('compiled')),
           recent_errors: consoleMessages.filter(msg => msg.type === 'error').length
         }
-      });
+      },
+        (text) => setStreamingContent(prev => prev + text),
+        (code) => setStreamingCodeLines(prev => prev + code.split('\n').length - 1)
+      );
 
       // Debug logging to see what we're getting from the backend
       console.log('AI Response:', {
@@ -148,6 +160,10 @@ export const AIAssistant: React.FC<AIAssistantProps> = ({ isCollapsed, onToggleC
         messagePreview: response.message.substring(0, 100)
       });
 
+      if (response.session_id) {
+        backendSessionIds.current[activeChatSessionId] = response.session_id;
+      }
+
       const assistantMessage = {
         id: `msg-${++messageIdCounter.current}-${Date.now()}`,
         role: 'assistant' as const,
@@ -178,6 +194,8 @@ export const AIAssistant: React.FC<AIAssistantProps> = ({ isCollapsed, onToggleC
       }
     } finally {
       setIsLoading(false);
+      setStreamingContent('');
+      setStreamingCodeLines(0);
     }
   };
 
@@ -386,10 +404,22 @@ export const AIAssistant: React.FC<AIAssistantProps> = ({ isCollapsed, onToggleC
         {isLoading && (
           <div className="text-left mb-3">
             <div className="inline-block bg-gray-700 rounded-lg p-3 mr-8">
-              <div className="flex items-center gap-2 text-sm text-gray-300">
-                <div className="animate-spin w-4 h-4 border-2 border-blue-400 border-t-transparent rounded-full"></div>
-                AI is thinking...
-              </div>
+              {streamingContent ? (
+                <div className="whitespace-pre-wrap text-sm text-gray-100">
+                  {/* Hide code still being written, it is shown in the diff viewer */}
+                  {cleanMessageContent(streamingContent.replace(/<modified_code>(?![\s\S]*<\/modified_code>)[\s\S]*$/, ''))}
+                  {streamingCodeLines > 0 && (
+                    <div className="mt-2 text-xs text-gray-400">
+                      Writing code changes... ({streamingCodeLines} lines)
+                    </div>
+                  )}
+                </div>
+              ) : (
+                <div className="flex items-center gap-2 text-sm text-gray-300">
+                  <div className="animate-spin w-4 h-4 border-2 border-blue-400 border-t-transparent rounded-full"></div>
+                  AI is thinking...
+                </div>
+              )}
             </div>
           </div>
         )}
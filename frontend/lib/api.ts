@@ -244,6 +244,7 @@ export interface ChatRequest {
   execution_logs?: string;  // Logs from Pyodide execution
   context?: Record<string, any>;
   conversation_history?: ChatMessage[];
+  session_id?: string;  // Backend chat session from a previous response
 }
 
 export interface ChatResponse {
@@ -253,6 +254,7 @@ export interface ChatResponse {
   suggestions?: string[];
   original_code?: string;
   modified_code?: string;
+  session_id?: string;  // Send back with the next request of the chat
 }
 
 export const aiApi = {
@@ -261,6 +263,56 @@ export const aiApi = {
     return response.data;
   },
 
+  // Stream the assistant reply, calling onDelta with each text chunk and
+  // onModifiedCode with each chunk of <modified_code> body as they arrive.
+  // Resolves with the final response once the stream is done. The done
+  // event omits the message when it was already sent as deltas.
+  chatStream: async (
+    request: ChatRequest,
+    onDelta: (text: string) => void,
+    onModifiedCode?: (text: string) => void
+  ): Promise<ChatResponse> => {
+    const response = await fetch(`${API_BASE_URL}/api/ai/chat/stream`, {
+      method: 'POST',
+      headers: { 'Content-Type': 'application/json' },
+      body: JSON.stringify(request),
+    });
+    if (!response.ok || !response.body) {
+      throw new Error(`Chat stream failed with status ${response.status}`);
+    }
+
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    let message = '';
+    while (true) {
+      const { done, value } = await reader.read();
+      if (done) break;
+      buffer += decoder.decode(value, { stream: true });
+
+      // Server-sent events are separated by a blank line
+      let boundary = buffer.indexOf('\n\n');
+      while (boundary >= 0) {
+        const line = buffer.slice(0, boundary);
+        buffer = buffer.slice(boundary + 2);
+        boundary = buffer.indexOf('\n\n');
+        if (!line.startsWith('data: ')) continue;
+
+        const event = JSON.parse(line.slice('data: '.length));
+        if (event.type === 'delta') {
+          message += event.text;
+          onDelta(event.text);
+        } else if (event.type === 'modified_code') {
+          onModifiedCode?.(event.text);
+        } else if (event.type === 'done') {
+          const { type, ...chatResponse } = event;
+          return { message, ...chatResponse } as ChatResponse;
+        }
+      }
+    }
+    throw new Error('Chat stream ended without a response');
+  },
+
   getSuggestions: async (): Promise<{ suggestions: string[] }> => {
     const response = await api.get('/api/ai/suggestions');
     return response.data;